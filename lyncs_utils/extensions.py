@@ -294,32 +294,117 @@ class FreezableDict(dict):
 
 
 class ndict(dict):
-    "A numerical dictionary that supports add, mul, etc"
+    """
+    A numerical dictionary that supports add, mul, etc.
+
+    The attribute `missing` (class-wide or per instance) sets the policy for keys
+    present in only one of the operands:
+    - "keep" (default): keys only in the left operand are kept unchanged,
+      keys only in the right one raise KeyError
+    - "fill": the missing values are replaced by `fill_value` (default 0)
+    - "skip": only the keys in both operands are kept
+    - "error": any mismatch of the keys raises KeyError
+
+    In-place operators (+=, -=, ...) update the dictionary and, where supported
+    (e.g. numpy arrays), its values without copying. Values are shared with
+    `ndict(dct)` but not with `dct.copy()`, which also copies the values.
+    """
+
+    missing = "keep"
+    fill_value = 0
 
-    def __ufunc__(self, other, fnc):
-        out = ndict(self)
-        if isinstance(other, Mapping):
+    def _shallow_copy(self):
+        "Shallow copy keeping the type and the policy"
+        out = type(self)(self)
+        out.__dict__.update(self.__dict__)
+        return out
+
+    def copy(self):
+        "Copy keeping the type and the policy, values are copied when they have a copy method"
+        out = self._shallow_copy()
+        for key, val in out.items():
+            if hasattr(val, "copy"):
+                out[key] = val.copy()
+        return out
+
+    def __ufunc__(self, other, fnc, inplace=False):
+        out = self if inplace else self._shallow_copy()
+        if not isinstance(other, Mapping):
+            for key, val in out.items():
+                out[key] = fnc(val, other)
+            return out
+
+        if self.missing == "keep":
+            if inplace and not out.keys() >= other.keys():
+                # checking in advance to not leave self half-updated
+                raise KeyError(f"Missing keys: {other.keys() - out.keys()}")
             for key, val in other.items():
                 out[key] = fnc(out[key], val)
-        else:
-            for key, val in self.items():
-                out[key] = fnc(val, other)
+            return out
+        if self.missing not in ("fill", "skip", "error"):
+            raise ValueError(f"Unknown policy for missing keys: {self.missing}")
+        if self.missing == "error" and out.keys() != other.keys():
+            raise KeyError(f"Keys mismatch: {out.keys() ^ other.keys()}")
+        if self.missing in ("fill", "skip"):
+            for key in out.keys() - other.keys():
+                if self.missing == "fill":
+                    out[key] = fnc(out[key], self.fill_value)
+                else:
+                    del out[key]
+
+        for key, val in other.items():
+            if key in out:
+                out[key] = fnc(out[key], val)
+            elif self.missing == "fill":
+                out[key] = fnc(self.fill_value, val)
+        return out
+
+    @classmethod
+    def sum(cls, dicts, start=None):
+        "Sums an iterable of dictionaries accumulating in-place"
+        dicts = iter(dicts)
+        if start is None:
+            try:
+                start = next(dicts)
+            except StopIteration as err:
+                raise ValueError("Sum of an empty iterable without start") from err
+        out = start.copy() if isinstance(start, cls) else cls(start).copy()
+        for dct in dicts:
+            out += dct
         return out
 
     def __add__(self, other):
         return self.__ufunc__(other, operator.add)
 
+    def __radd__(self, other):
+        return self.__ufunc__(other, lambda left, right: right + left)
+
+    def __iadd__(self, other):
+        return self.__ufunc__(other, operator.iadd, inplace=True)
+
     def __sub__(self, other):
         return self.__ufunc__(other, operator.sub)
 
+    def __isub__(self, other):
+        return self.__ufunc__(other, operator.isub, inplace=True)
+
     def __mul__(self, other):
         return self.__ufunc__(other, operator.mul)
 
     def __rmul__(self, other):
         return self.__ufunc__(other, operator.mul)
 
+    def __imul__(self, other):
+        return self.__ufunc__(other, operator.imul, inplace=True)
+
     def __truediv__(self, other):
         return self.__ufunc__(other, operator.truediv)
 
+    def __itruediv__(self, other):
+        return self.__ufunc__(other, operator.itruediv, inplace=True)
+
     def __pow__(self, other):
         return self.__ufunc__(other, operator.pow)
+
+    def __ipow__(self, other):
+        return self.__ufunc__(other, operator.ipow, inplace=True)
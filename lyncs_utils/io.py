@@ -7,24 +7,60 @@ __all__ = [
     "open_file",
     "read",
     "write",
+    "aread",
+    "awrite",
+    "aread_struct",
+    "async_executor",
     "read_struct",
     "write_struct",
+    "read_parallel",
+    "read_structs",
+    "iter_structs",
+    "write_structs",
+    "read_array",
+    "write_array",
     "file_size",
     "to_path",
+    "FileIndex",
     "dbdict",
+    "array_dumps",
+    "array_loads",
 ]
 
+import asyncio
+import inspect
 import pickle
+import re
+import sys
+import lzma
+import zlib
 import os
 import struct
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from functools import wraps, partial
-from io import IOBase
+from functools import wraps, partial, lru_cache
+from io import IOBase, UnsupportedOperation
+from itertools import islice
+from mmap import mmap as _mmap, ACCESS_READ, ACCESS_WRITE
 from pathlib import Path
 from tempfile import _TemporaryFileWrapper
-from collections.abc import MutableMapping
+from types import SimpleNamespace
+from collections import OrderedDict, namedtuple
+from collections.abc import (
+    Sequence,
+    Mapping,
+    MutableMapping,
+    KeysView,
+    ItemsView,
+    ValuesView,
+)
 from sqlite3 import dbapi2 as sqlite
-
+from .extensions import raiseif
+from .math import prod
+from .numpy import numpy
 
 FileLike = (
     IOBase,
@@ -52,11 +88,25 @@ def open_file(fnc=None, arg=0, mode="rb", flag=None, **kwargs_open):
     if fnc is None:
         return partial(open_file, arg=arg, mode=mode, **kwargs_open)
 
-    @wraps(fnc)
-    def wrapped(*args, **kwargs):
+    def get_args(args):
         if len(args) <= arg:
             raise ValueError(f"filename not found at position {arg}")
-        args = list(args)
+        return list(args)
+
+    if inspect.iscoroutinefunction(fnc):
+
+        @wraps(fnc)
+        async def awrapped(*args, **kwargs):
+            args = get_args(args)
+            with fopen(args[arg], mode=mode, **kwargs_open) as fptr:
+                args[arg] = fptr
+                return await fnc(*args, **kwargs)
+
+        return awrapped
+
+    @wraps(fnc)
+    def wrapped(*args, **kwargs):
+        args = get_args(args)
         with fopen(args[arg], mode=mode, **kwargs_open) as fptr:
             args[arg] = fptr
             return fnc(*args, **kwargs)
@@ -64,33 +114,290 @@ def open_file(fnc=None, arg=0, mode="rb", flag=None, **kwargs_open):
     return wrapped
 
 
+_ASYNC = SimpleNamespace(executor=None)
+
+
+def async_executor(workers=None):
+    """
+    Returns the executor used by the async functions (e.g. `aread`).
+    If `workers` is given, it is replaced by a new one with as many threads,
+    which bounds the number of concurrent I/O operations.
+    """
+    if workers is not None or _ASYNC.executor is None:
+        if _ASYNC.executor is not None:
+            _ASYNC.executor.shutdown(wait=False)
+        _ASYNC.executor = ThreadPoolExecutor(workers, thread_name_prefix="lyncs_io")
+    return _ASYNC.executor
+
+
+async def _run_async(fnc, *args, **kwargs):
+    "Runs the function in the executor of the async functions"
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(async_executor(), partial(fnc, *args, **kwargs))
+
+
 @open_file
-def read(_fp, size=None):
-    "Reads data from file"
+def read(_fp, size=None, offset=None):
+    """
+    Reads data from file.
+    If offset is given, data is read from there without moving the file position.
+    """
+    if offset is not None:
+        return _pread(_fp, size, offset)
     if size is None:
         return _fp.read()
     return _fp.read(size)
 
 
+def _pread(_fp, size, offset):
+    "Reads data at offset from an open file without moving the file position"
+    if size is None:
+        size = max(file_size(_fp) - offset, 0)
+    try:
+        fno = _fp.fileno()
+    except (AttributeError, UnsupportedOperation):
+        fno = None
+    if fno is not None and hasattr(os, "pread"):
+        _fp.flush()
+        return os.pread(fno, size, offset)
+    position = _fp.tell()
+    try:
+        _fp.seek(offset)
+        return _fp.read(size)
+    finally:
+        _fp.seek(position)
+
+
 @open_file(mode="wb")
 def write(_fp, data):
     "Writes data to file"
     _fp.write(data)
 
 
+async def aread(_fp, size=None):
+    "Reads data from file without blocking the event loop"
+    return await _run_async(read, _fp, size)
+
+
+async def awrite(_fp, data):
+    "Writes data to file without blocking the event loop"
+    return await _run_async(write, _fp, data)
+
+
+def _pread_into(fno, buf, offset):
+    "Fills the buffer with data from the file descriptor starting at offset"
+    while buf:
+        if hasattr(os, "preadv"):
+            nbytes = os.preadv(fno, [buf], offset)
+        else:
+            data = os.pread(fno, len(buf), offset)
+            nbytes = len(data)
+            buf[:nbytes] = data
+        if not nbytes:
+            raise ValueError("File too short for the requested size")
+        buf = buf[nbytes:]
+        offset += nbytes
+
+
+@open_file
+def read_parallel(_fp, size=None, offset=0, chunk=2**24, workers=None, out=None):
+    """
+    Reads data from file using a pool of threads, each reading a chunk (in bytes).
+    The data is read into `out` if given (e.g. a numpy array) or a new bytearray.
+    """
+    if size is None:
+        size = file_size(_fp) - offset
+    if out is None:
+        out = bytearray(size)
+    buf = memoryview(out).cast("B")
+    if len(buf) < size:
+        raise ValueError(f"Output buffer too small for reading {size} bytes")
+    buf = buf[:size]
+    fno = _fp.fileno()
+    with ThreadPoolExecutor(workers) as pool:
+        jobs = [
+            pool.submit(_pread_into, fno, buf[start : start + chunk], offset + start)
+            for start in range(0, size, chunk)
+        ]
+        for job in jobs:
+            job.result()
+    return out
+
+
 def read_struct(_fp, fmt):
     "Reads struct from file of given format (see struct)"
-    data = read(_fp, struct.calcsize(fmt))
-    data = struct.unpack_from(fmt, data)
+    fmt = _struct(fmt)
+    data = read(_fp, fmt.size)
+    data = fmt.unpack_from(data)
     return data
 
 
+async def aread_struct(_fp, fmt):
+    "Reads struct from file of given format (see struct) without blocking the event loop"
+    return await _run_async(read_struct, _fp, fmt)
+
+
 def write_struct(_fp, fmt, *data):
     "Writes struct to file of given format (see struct)"
     data = struct.pack(fmt, *data)
     write(_fp, data)
 
 
+@lru_cache(maxsize=None)
+def _struct(fmt):
+    "Returns a precompiled struct.Struct"
+    return struct.Struct(fmt)
+
+
+# Kind of numpy type corresponding to struct format characters
+STRUCT_KINDS = dict.fromkeys("bhilqn", "i")
+STRUCT_KINDS.update(dict.fromkeys("BHILQNP", "u"))
+STRUCT_KINDS.update(dict.fromkeys("efd", "f"))
+STRUCT_KINDS.update({"?": "b", "c": "S", "s": "S"})
+
+
+@lru_cache(maxsize=None)
+def _struct_dtype(fmt):
+    "Converts a struct format into an equivalent numpy structured dtype"
+    order = fmt[0] if fmt[:1] in "@=<>!" else "@"
+    prefix = {"@": "=", "!": ">"}.get(order, order)
+    names, formats, offsets = [], [], []
+    done = order
+    for num, char in re.findall(r"(\d*)([a-zA-Z?])", fmt.lstrip("@=<>!")):
+        items = [num + char] if char in "sx" else [char] * int(num or 1)
+        for item in items:
+            if char != "x":
+                if char not in STRUCT_KINDS:
+                    raise ValueError(f"Format {char} not supported by numpy")
+                names.append(f"f{len(names)}")
+                # zero-sized item for getting the aligned offset
+                offsets.append(struct.calcsize(done + "0" + char))
+                size = struct.calcsize(order + item)
+                formats.append(prefix + STRUCT_KINDS[char] + str(size))
+            done += item
+    return numpy.dtype(
+        {
+            "names": names,
+            "formats": formats,
+            "offsets": offsets,
+            "itemsize": struct.calcsize(fmt),
+        }
+    )
+
+
+@open_file
+def read_structs(_fp, fmt, count=None, as_array=False):
+    """
+    Reads `count` consecutive structs of given format (see struct) from file,
+    or all of them till the end of file if `count` is None.
+    Returns a list of tuples or, if `as_array`, a numpy structured array.
+    """
+    fmt = _struct(fmt)
+    data = _fp.read() if count is None else _fp.read(fmt.size * count)
+    if count is not None and len(data) != fmt.size * count:
+        raise ValueError(f"File too short for reading {count} structs")
+    if len(data) % fmt.size:
+        raise ValueError("File does not contain a whole number of structs")
+    if as_array:
+        return numpy.frombuffer(data, dtype=_struct_dtype(fmt.format))
+    return list(fmt.iter_unpack(data))
+
+
+def iter_structs(_fp, fmt, chunk=2**14):
+    """
+    Iterates over the structs of given format (see struct) in a file
+    reading `chunk` structs at once.
+    """
+    fmt = _struct(fmt)
+    with fopen(_fp) as fptr:
+        while True:
+            data = fptr.read(fmt.size * chunk)
+            if len(data) % fmt.size:
+                raise ValueError("File does not contain a whole number of structs")
+            yield from fmt.iter_unpack(data)
+            if len(data) < fmt.size * chunk:
+                return
+
+
+@open_file(mode="wb")
+def write_structs(_fp, fmt, data, chunk=2**14):
+    """
+    Writes many structs of given format (see struct) to file.
+    Data is either an iterable of tuples or a numpy structured array.
+    """
+    fmt = _struct(fmt)
+    if not isinstance(numpy, Exception) and isinstance(data, numpy.ndarray):
+        if data.dtype.itemsize != fmt.size:
+            raise ValueError(
+                f"Itemsize {data.dtype.itemsize} does not match {fmt.size}"
+            )
+        _fp.write(memoryview(numpy.ascontiguousarray(data)).cast("B"))
+        return
+    data = iter(data)
+    while True:
+        buf = b"".join(fmt.pack(*vals) for vals in islice(data, chunk))
+        if not buf:
+            return
+        _fp.write(buf)
+
+
+def read_array(_fp, dtype, shape, offset=0, mmap=True, writeable=False):
+    """
+    Reads an array of given dtype and shape from file starting at offset (in bytes).
+    If mmap, the file is memory-mapped and only the accessed parts are read from disk.
+    Returns a numpy array if numpy is available, otherwise a memoryview;
+    in the latter case dtype must be a struct format character (e.g. "d").
+    If writeable, changes to a memory-mapped array are written to the file.
+    """
+    if isinstance(shape, int):
+        shape = (shape,)
+    shape = tuple(shape)
+    has_numpy = not isinstance(numpy, Exception)
+    if has_numpy:
+        itemsize = numpy.dtype(dtype).itemsize
+    else:
+        itemsize = struct.calcsize(dtype)
+    nbytes = prod(shape) * itemsize
+
+    with fopen(_fp, mode="r+b" if writeable else "rb") as fptr:
+        if mmap and has_numpy:
+            mode = "r+" if writeable else "r"
+            return numpy.memmap(
+                fptr, dtype=dtype, mode=mode, offset=offset, shape=shape
+            )
+        if mmap:
+            access = ACCESS_WRITE if writeable else ACCESS_READ
+            buf = _mmap(fptr.fileno(), offset + nbytes, access=access)
+            buf = memoryview(buf)[offset:]
+        else:
+            if has_numpy:
+                arr = numpy.empty(shape, dtype=dtype)
+                buf = memoryview(arr).cast("B")
+            else:
+                buf = memoryview(bytearray(nbytes))
+            fptr.seek(offset)
+            if fptr.readinto(buf) != nbytes:
+                raise ValueError(f"File too short for reading {nbytes} bytes")
+            if has_numpy:
+                return arr
+    return buf.cast(dtype, shape)
+
+
+def write_array(_fp, arr, offset=None):
+    """
+    Writes an array (or any buffer) to file without copying it, if contiguous.
+    If offset (in bytes) is given, the data is written at offset into the existing file,
+    otherwise the file is overwritten.
+    """
+    if not isinstance(numpy, Exception) and isinstance(arr, numpy.ndarray):
+        arr = numpy.ascontiguousarray(arr)
+    data = memoryview(arr).cast("B")
+    with fopen(_fp, mode="wb" if offset is None else "r+b") as fptr:
+        if offset is not None:
+            fptr.seek(offset)
+        fptr.write(data)
+
+
 @open_file
 def file_size(_fp):
     "Returns the file size"
@@ -110,10 +417,118 @@ def to_path(filename):
     return Path(filename)
 
 
+class FileIndex(Sequence):
+    """
+    Persistent index of the records (offset and size) of a file.
+    The index is stored next to the file and rebuilt only when the file changes.
+    """
+
+    header = _struct("<4sQQQ")
+    magic = b"LYIX"
+
+    def __init__(self, filename, scan=None, suffix=".idx"):
+        """
+        Persistent index of the records (offset and size) of a file
+
+        Parameters
+        ----------
+        - filename: the file to index
+        - scan: function that given the opened file yields the (offset, size) of its records.
+          It is called only if the index file is missing or out of date.
+        - suffix: suffix added to the filename for storing the index, default `.idx`
+        """
+        self.filename = to_path(filename)
+        self.index_file = self.filename.with_name(self.filename.name + suffix)
+        self.scan = scan
+        self.records = array("Q")
+        if not self.load():
+            self.build()
+
+    @property
+    def stamp(self):
+        "Size and modification time of the file, used to check if the index is valid"
+        stat = os.stat(self.filename)
+        return stat.st_size, stat.st_mtime_ns
+
+    def load(self):
+        "Loads the index from disk. Returns False if missing or out of date"
+        try:
+            with open(self.index_file, "rb") as fptr:
+                magic, num, *stamp = self.header.unpack(fptr.read(self.header.size))
+                if magic != self.magic or tuple(stamp) != self.stamp:
+                    return False
+                records = array("Q")
+                records.fromfile(fptr, 2 * num)
+        except (OSError, EOFError, struct.error):
+            return False
+        if sys.byteorder != "little":
+            records.byteswap()
+        self.records = records
+        return True
+
+    def build(self):
+        "Scans the file and saves the index to disk"
+        if self.scan is None:
+            raise ValueError(
+                f"Index of {self.filename} not available and scan not given"
+            )
+        stamp = self.stamp
+        records = array("Q")
+        with open(self.filename, "rb") as fptr:
+            for offset, size in self.scan(fptr):
+                records.append(offset)
+                records.append(size)
+        self.records = records
+        if sys.byteorder != "little":
+            records = array("Q", records)
+            records.byteswap()
+        with open(self.index_file, "wb") as fptr:
+            fptr.write(self.header.pack(self.magic, len(records) // 2, *stamp))
+            records.tofile(fptr)
+
+    def __len__(self):
+        return len(self.records) // 2
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("FileIndex index out of range")
+        return self.records[2 * idx], self.records[2 * idx + 1]
+
+    def read(self, *idxs, fp=None):
+        """
+        Returns the data of the records at the given positions.
+        An opened file can be passed as `fp` for reading many records efficiently.
+        """
+        with fopen(self.filename if fp is None else fp) as fptr:
+            out = [
+                read(fptr, size, offset=offset)
+                for offset, size in map(self.__getitem__, idxs)
+            ]
+        if len(idxs) == 1:
+            return out[0]
+        return out
+
+
 class dbdict(MutableMapping):
     """A dictionary-like class for storing dictionaries in a database"""
 
-    def __init__(self, *args, filename="", loads=pickle.loads, dumps=pickle.dumps):
+    def __init__(
+        self,
+        *args,
+        filename="",
+        loads=pickle.loads,
+        dumps=pickle.dumps,
+        fetch_size=1000,
+        concurrent=False,
+        timeout=5.0,
+        retries=10,
+        cache_size=0,
+        cache_bytes=None,
+    ):
         """
         A dictionary-like class for storing dictionaries in a database
 
@@ -121,49 +536,387 @@ class dbdict(MutableMapping):
         ----------
         - filename: filename for storing the database,cdefault `.sqlite`
         - loads: serializer for loading, default `pickle.loads`
-        - dumps: serializer for dumping, default `pickle.dumps`
+        - dumps: serializer for dumping, default `pickle.dumps`.
+          For large arrays use `array_dumps` and `array_loads` instead.
+        - fetch_size: number of rows fetched at once while iterating, default 1000
+        - concurrent: enables access from many threads and processes, default False.
+          It uses WAL journaling, a connection per thread and retries on locks.
+        - timeout: seconds to wait for a locked database, default 5
+        - retries: number of retries on a locked database in concurrent mode, default 10
+        - cache_size: max number of loaded values kept in memory (LRU), default 0 (disabled).
+          Cached values are returned as they are, so they should not be modified in-place.
+          In concurrent mode, changes made by other processes are not seen by the cache.
+        - cache_bytes: max size of the serialized cached values, default None (unlimited)
         """
 
         self.filename = filename
         self.dumps = dumps
         self.loads = loads
+        self.fetch_size = fetch_size
+        self.concurrent = concurrent
+        self.timeout = timeout
+        self.retries = retries if concurrent else 0
+        self._local = threading.local() if concurrent else SimpleNamespace()
+        self._cache = _LRUCache(cache_size, cache_bytes)
         if not self.filename.endswith(".sqlite"):
             self.filename += ".sqlite"
 
-        if not os.path.isfile(self.filename):
-            self.con = sqlite.connect(self.filename)
-            self.con.execute("create table data (key PRIMARY KEY,value)")
-        else:
-            self.con = sqlite.connect(self.filename)
+        # Opening the connection eagerly to create the table
+        self.con.commit()
 
         if args:
             self.update(*args)
 
+    def _connect(self):
+        "Opens a new connection to the database"
+        con = sqlite.connect(self.filename, timeout=self.timeout)
+        if self.concurrent:
+            self._retry(con.execute, "pragma journal_mode=wal")
+        self._retry(
+            con.execute, "create table if not exists data (key PRIMARY KEY,value)"
+        )
+        self._retry(con.commit)
+        return con
+
+    @property
+    def _state(self):
+        "Connection and transaction depth of the current thread and process"
+        state = self._local
+        if getattr(state, "pid", None) != os.getpid():
+            # New process (e.g. after a fork) or new thread
+            state.con = self._connect()
+            state.pid = os.getpid()
+            state.depth = 0
+        return state
+
+    @property
+    def con(self):
+        "The connection to the database"
+        return self._state.con
+
+    def _retry(self, fnc, *args):
+        "Calls the function retrying if the database is locked"
+        for attempt in range(self.retries + 1):
+            try:
+                return fnc(*args)
+            except sqlite.OperationalError as err:
+                msg = str(err)
+                if attempt == self.retries or not ("locked" in msg or "busy" in msg):
+                    raise
+                time.sleep(0.01 * 2 ** min(attempt, 6))
+        return None
+
+    def _commit(self):
+        "Commits the changes unless within a transaction"
+        if not self._state.depth:
+            self._retry(self.con.commit)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Context manager that groups all the changes in a single transaction.
+        The changes are committed on exit or rolled back if an exception is raised.
+        Transactions can be nested and only the outermost one commits, while
+        the inner ones are savepoints that roll back only their own changes.
+        """
+        state = self._state
+        if not state.depth:
+            if not self.con.in_transaction:
+                self._retry(self.con.execute, "begin")
+        else:
+            self.con.execute(f"savepoint level{state.depth}")
+        state.depth += 1
+        try:
+            yield self
+        except BaseException:
+            state.depth -= 1
+            if not state.depth:
+                self.con.rollback()
+            else:
+                self.con.execute(f"rollback to level{state.depth}")
+                self.con.execute(f"release level{state.depth}")
+            self._cache.clear()
+            raise
+        state.depth -= 1
+        if state.depth:
+            self.con.execute(f"release level{state.depth}")
+        self._commit()
+
+    batch = transaction
+
+    def cache_info(self):
+        "Returns statistics of the read cache (see functools.lru_cache)"
+        return self._cache.info()
+
+    def cache_clear(self):
+        "Clears the read cache and its statistics"
+        self._cache.clear()
+
     def __getitem__(self, key):
+        val = self._cache.get(key)
+        if val is not _MISSING:
+            return val
         row = self.con.execute("select value from data where key=?", (key,)).fetchone()
         if not row:
             raise KeyError
-        return self.loads(row[0])
+        val = self.loads(row[0])
+        self._cache.put(key, val, len(row[0]))
+        return val
 
     def __setitem__(self, key, item):
-        item = self.dumps(item)
-        if self.con.execute("select key from data where key=?", (key,)).fetchone():
-            self.con.execute("update data set value=? where key=?", (item, key))
-        else:
-            self.con.execute("insert into data (key,value) values (?,?)", (key, item))
-        self.con.commit()
+        self.setmany(((key, item),))
 
     def __delitem__(self, key):
-        if self.con.execute("select key from data where key=?", (key,)).fetchone():
-            self.con.execute("delete from data where key=?", (key,))
-            self.con.commit()
-        else:
+        self._cache.pop(key)
+        cur = self._retry(self.con.execute, "delete from data where key=?", (key,))
+        self._commit()
+        if not cur.rowcount:
             raise KeyError(f"{key} not in dictonary")
 
+    def _fetch(self, query):
+        "Streams the rows of a query fetching `fetch_size` rows at once"
+        cur = self.con.execute(query)
+        while True:
+            rows = cur.fetchmany(self.fetch_size)
+            if not rows:
+                return
+            yield from rows
+
     def __iter__(self):
-        # TODO use iterable fetch
-        return (row[0] for row in self.con.execute("select key from data").fetchall())
+        return (row[0] for row in self._fetch("select key from data"))
 
     def __len__(self):
-        # TODO find cheaper way
-        return len(self.con.execute("select key from data").fetchall())
+        return self.con.execute("select count(*) from data").fetchone()[0]
+
+    def keys(self, sort=False):
+        "Keys streamed from the database, optionally sorted by key"
+        return _dbKeysView(self, sort)
+
+    def values(self, sort=False):
+        "Values streamed from the database, optionally sorted by key"
+        return _dbValuesView(self, sort)
+
+    def items(self, sort=False):
+        "Items streamed from the database, optionally sorted by key"
+        return _dbItemsView(self, sort)
+
+    def setmany(self, items):
+        "Sets many (key, value) pairs in a single transaction"
+        items = [(key, self.dumps(val)) for key, val in items]
+        for key, _ in items:
+            self._cache.pop(key)
+        self._retry(
+            self.con.executemany,
+            "insert or replace into data (key,value) values (?,?)",
+            items,
+        )
+        self._commit()
+
+    def getmany(self, keys, default=None):
+        "Returns the values of many keys. Missing keys return `default`"
+        keys = list(keys)
+        found = {key: self._cache.get(key) for key in keys}
+        missing = [key for key, val in found.items() if val is _MISSING]
+        # SQLite limits the number of variables per query
+        for start in range(0, len(missing), 500):
+            chunk = missing[start : start + 500]
+            marks = ",".join("?" * len(chunk))
+            query = f"select key,value from data where key in ({marks})"
+            for key, val in self.con.execute(query, chunk):
+                found[key] = self.loads(val)
+                self._cache.put(key, found[key], len(val))
+        return [default if found[key] is _MISSING else found[key] for key in keys]
+
+    def delmany(self, keys):
+        "Deletes many keys in a single transaction. Missing keys are ignored"
+        keys = [(key,) for key in keys]
+        for (key,) in keys:
+            self._cache.pop(key)
+        self._retry(self.con.executemany, "delete from data where key=?", keys)
+        self._commit()
+
+    def update(self, *args, **kwargs):
+        "Updates the dictionary in a single transaction (see dict.update)"
+        if len(args) > 1:
+            raise TypeError(f"update expected at most 1 argument, got {len(args)}")
+        with self.transaction():
+            for arg in args:
+                if isinstance(arg, Mapping):
+                    arg = arg.items()
+                elif hasattr(arg, "keys"):
+                    arg = ((key, arg[key]) for key in arg.keys())
+                self.setmany(arg)
+            self.setmany(kwargs.items())
+
+
+ARRAY_MAGIC = b"LYAR"
+# The position in the tuple is the flag stored in the header
+COMPRESSIONS = (None, "zlib", "lzma")
+COMPRESSORS = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+# Out-of-band buffers require pickle protocol 5, available from Python 3.8
+requires_pickle5 = raiseif(
+    pickle.HIGHEST_PROTOCOL < 5,
+    RuntimeError(
+        "array_dumps and array_loads require Python >= 3.8 (pickle protocol 5)"
+    ),
+)
+
+
+@requires_pickle5
+def array_dumps(obj, compress=None, threshold=2**20):
+    """
+    Serializes an object storing its buffers (e.g. of numpy arrays) out-of-band,
+    via pickle protocol 5, so that they are copied only once into the output.
+
+    Parameters
+    ----------
+    - compress: compression to apply, one of None, "zlib", "lzma"
+    - threshold: minimal size in bytes for applying the compression, default 1MB
+    """
+    if compress not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression {compress}. Use one of {COMPRESSIONS}")
+    buffers = []
+    data = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    buffers = [buf.raw() for buf in buffers]
+    header = struct.pack(
+        f"<QI{len(buffers)}Q", len(data), len(buffers), *map(len, buffers)
+    )
+    payload = [header, data, *buffers]
+    if compress is not None and sum(map(len, payload)) >= threshold:
+        payload = [COMPRESSORS[compress][0](b"".join(payload))]
+    else:
+        compress = None
+    flag = bytes((COMPRESSIONS.index(compress),))
+    return b"".join([ARRAY_MAGIC, flag, *payload])
+
+
+@requires_pickle5
+def array_loads(data):
+    """
+    Deserializes the output of `array_dumps`. The buffers are not copied
+    and arrays are returned as read-only views of `data`.
+    """
+    data = memoryview(data)
+    if data[: len(ARRAY_MAGIC)] != ARRAY_MAGIC:
+        raise ValueError("Data has not been serialized with array_dumps")
+    compress = COMPRESSIONS[data[len(ARRAY_MAGIC)]]
+    data = data[len(ARRAY_MAGIC) + 1 :]
+    if compress is not None:
+        data = memoryview(COMPRESSORS[compress][1](data))
+    size, nbuf = struct.unpack_from("<QI", data)
+    offset = struct.calcsize("<QI")
+    sizes = struct.unpack_from(f"<{nbuf}Q", data, offset)
+    offset += struct.calcsize(f"<{nbuf}Q")
+    pickled = data[offset : offset + size]
+    offset += size
+    buffers = []
+    for size in sizes:
+        buffers.append(data[offset : offset + size])
+        offset += size
+    return pickle.loads(pickled, buffers=buffers)
+
+
+_MISSING = object()
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize", "nbytes"])
+
+
+class _LRUCache:
+    "Bounded least-recently-used cache of loaded values"
+
+    def __init__(self, maxsize=0, maxbytes=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        "Empties the cache and resets the statistics"
+        with self.lock:
+            self.data.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def get(self, key):
+        "Returns the cached value or _MISSING"
+        if not self.maxsize:
+            return _MISSING
+        with self.lock:
+            try:
+                val, _ = self.data[key]
+            except (KeyError, TypeError):
+                self.misses += 1
+                return _MISSING
+            self.data.move_to_end(key)
+            self.hits += 1
+            return val
+
+    def put(self, key, val, nbytes):
+        "Adds a value to the cache evicting the least recently used ones"
+        if not self.maxsize or (self.maxbytes is not None and nbytes > self.maxbytes):
+            return
+        with self.lock:
+            if key in self.data:
+                self.nbytes -= self.data.pop(key)[1]
+            self.data[key] = (val, nbytes)
+            self.nbytes += nbytes
+            while len(self.data) > self.maxsize or (
+                self.maxbytes is not None and self.nbytes > self.maxbytes
+            ):
+                self.nbytes -= self.data.popitem(last=False)[1][1]
+
+    def pop(self, key):
+        "Removes a key from the cache, if present"
+        if not self.data:
+            return
+        with self.lock:
+            try:
+                self.nbytes -= self.data.pop(key)[1]
+            except (KeyError, TypeError):
+                pass
+
+    def info(self):
+        "Returns the cache statistics"
+        return CacheInfo(
+            self.hits, self.misses, self.maxsize, len(self.data), self.nbytes
+        )
+
+
+class _dbView:
+    "Mixin for the views of a dbdict, optionally sorted by key"
+
+    def __init__(self, mapping, sort=False):
+        super().__init__(mapping)
+        self._order = " order by key" if sort else ""
+
+    def _rows(self, columns):
+        return self._mapping._fetch(f"select {columns} from data{self._order}")
+
+
+class _dbKeysView(_dbView, KeysView):
+    "Keys of a dbdict streamed from the database"
+
+    def __iter__(self):
+        return (row[0] for row in self._rows("key"))
+
+
+class _dbValuesView(_dbView, ValuesView):
+    "Values of a dbdict streamed from the database"
+
+    def __iter__(self):
+        loads = self._mapping.loads
+        return (loads(row[0]) for row in self._rows("value"))
+
+
+class _dbItemsView(_dbView, ItemsView):
+    "Items of a dbdict streamed from the database"
+
+    def __iter__(self):
+        loads = self._mapping.loads
+        return ((key, loads(val)) for key, val in self._rows("key,value"))
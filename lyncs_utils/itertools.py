@@ -6,20 +6,31 @@ __all__ = [
     "first",
     "last",
     "indexes",
+    "IndexMap",
     "keys",
     "values",
     "items",
     "dictmap",
     "dictzip",
+    "dictzip_columns",
     "flat_dict",
     "nest_dict",
     "allclose",
     "compact_indexes",
+    "compact_ranges",
+    "RangeSet",
 ]
 
-from collections.abc import Mapping
+from bisect import bisect_right
+from collections.abc import Mapping, Set
+from heapq import merge
+from itertools import chain, groupby
+from operator import itemgetter
+from math import gcd
+from numbers import Integral
 from .logical import isiterable
-from .math import isclose
+from .math import isclose, _is_numeric_array, _isclose_arrays
+from .numpy import numpy
 
 
 def first(iterable):
@@ -33,7 +44,18 @@ def last(iterable):
 
 
 def indexes(iterable, val):
-    "Returns all indexes of an occurrance"
+    """
+    Returns all indexes of an occurrance.
+    For many lookups on the same iterable use IndexMap.
+    """
+    if not isinstance(numpy, Exception) and isinstance(iterable, numpy.ndarray):
+        yield from numpy.flatnonzero(iterable == val).tolist()
+        return
+    if not hasattr(iterable, "index"):
+        for index, elem in enumerate(iterable):
+            if elem == val:
+                yield index
+        return
     start = 0
     while True:
         try:
@@ -44,6 +66,65 @@ def indexes(iterable, val):
             return
 
 
+class IndexMap(Mapping):
+    """
+    Maps the values of an iterable to all the indexes where they occur.
+    It is built once in O(n) and each lookup returns the sorted indexes of a value.
+    For numpy arrays, the values are sorted with a stable argsort and looked up
+    with searchsorted, and the indexes refer to the flattened array.
+
+    Examples
+    --------
+    >>> IndexMap("abcab")["a"]
+    (0, 3)
+    """
+
+    def __init__(self, iterable):
+        if not isinstance(numpy, Exception) and isinstance(iterable, numpy.ndarray):
+            values = numpy.ravel(iterable)
+            self._order = numpy.argsort(values, kind="stable")
+            self._order.flags.writeable = False
+            self._sorted = values[self._order]
+            self._index = None
+        else:
+            self._index = {}
+            for index, val in enumerate(iterable):
+                self._index.setdefault(val, []).append(index)
+
+    def indexes(self, val):
+        "Returns the indexes of val, empty if not found"
+        if self._index is not None:
+            return tuple(self._index.get(val, ()))
+        start, stop = (
+            numpy.searchsorted(self._sorted, val, side=side)
+            for side in ("left", "right")
+        )
+        return self._order[start:stop]
+
+    def __getitem__(self, val):
+        out = self.indexes(val)
+        if not len(out):
+            raise KeyError(val)
+        return out
+
+    def count(self, val):
+        "Number of occurrences of val"
+        return len(self.indexes(val))
+
+    def __contains__(self, val):
+        return self.count(val) > 0
+
+    def __iter__(self):
+        if self._index is not None:
+            return iter(self._index)
+        return iter(numpy.unique(self._sorted).tolist())
+
+    def __len__(self):
+        if self._index is not None:
+            return len(self._index)
+        return len(numpy.unique(self._sorted))
+
+
 def keys(dct):
     "Calls keys, if available, or dict.keys"
     try:
@@ -74,57 +155,231 @@ def dictmap(fnc, dct):
         yield key, fnc(val)
 
 
-def dictzip(*dicts, fill=True, default=None, values_only=False):
+def dictzip(
+    *dicts, fill=True, default=None, values_only=False, ordered=False, key=None
+):
     """
     Zip for dictionaries.
     Missing keys are optionally filled with a given default value, otherwise ignored.
+    Keys are returned in order of first appearance.
+
+    If `ordered`, the dictionaries (or iterables of pairs) must be sorted by key
+    (according to `key`, if given) and are merged in streaming keeping the order.
+    Mappings are read with `items(sort=True)` when supported (e.g. dbdict) and
+    unsorted inputs raise ValueError.
     """
 
-    if fill:
-        all_keys = set.union(*map(set, map(keys, dicts)))
-    else:
-        all_keys = set.intersection(*map(set, map(keys, dicts)))
+    if ordered:
+        yield from _dictzip_ordered(dicts, fill, default, values_only, key)
+        return
 
-    for key in all_keys:
-        vals = tuple(map(lambda _: _.get(key, default), dicts))
+    for name in _dictzip_keys(dicts, fill):
+        vals = tuple(map(lambda _: _.get(name, default), dicts))
         if values_only:
             yield vals
         else:
-            yield key, vals
+            yield name, vals
 
 
-def flat_dict(dct, sep=None, base=()):
-    "Flats a nested dictionary into a single dictionary with key that is either a tuple or joint with `sep` (if given)"
-    for key, val in items(dct):
-        key = base + (key,)
-        if isinstance(val, Mapping):
-            yield from flat_dict(val, sep=sep, base=key)
+_MISSING = object()
+
+
+def _dictzip_keys(dicts, fill):
+    "Union (if fill) or intersection of the keys in order of first appearance"
+    if fill:
+        return dict.fromkeys(chain.from_iterable(map(keys, dicts)))
+    others = tuple(map(set, map(keys, dicts[1:])))
+    return (key for key in keys(dicts[0]) if all(key in other for other in others))
+
+
+def _indexed_pairs(idx, dct):
+    "Yields (key, idx, value) for the items of a mapping or an iterable of pairs"
+    if isinstance(dct, Mapping):
+        try:
+            # e.g. dbdict
+            dct = dct.items(sort=True)
+        except TypeError:
+            dct = items(dct)
+    for key, val in dct:
+        yield key, idx, val
+
+
+def _dictzip_ordered(dicts, fill, default, values_only, key):
+    "Streaming k-way merge of sorted dictionaries or iterables of pairs"
+    merged = merge(
+        *map(_indexed_pairs, range(len(dicts)), dicts),
+        key=itemgetter(0) if key is None else (lambda entry: key(entry[0])),
+    )
+    last = _MISSING
+    for name, group in groupby(merged, itemgetter(0)):
+        # an unsorted input always gives a decreasing step in the merged output
+        this = name if key is None else key(name)
+        if last is not _MISSING and this < last:
+            raise ValueError(f"Inputs are not sorted by key: {name} after {last}")
+        last = this
+        vals = [default] * len(dicts)
+        found = set()
+        for _, idx, val in group:
+            vals[idx] = val
+            found.add(idx)
+        if not fill and len(found) < len(dicts):
+            continue
+        if values_only:
+            yield tuple(vals)
         else:
-            if sep is not None:
-                key = sep.join(key)
+            yield name, tuple(vals)
+
+
+def dictzip_columns(
+    *dicts, fill=True, default=float("nan"), dtype=float, ordered=False
+):
+    """
+    Vectorized dictzip for numerical values.
+    Returns the list of keys and a tuple of numpy arrays, one per dictionary,
+    with the values aligned to the keys.
+    """
+    if ordered:
+        names, rows = [], []
+        for name, vals in dictzip(*dicts, fill=fill, default=default, ordered=True):
+            names.append(name)
+            rows.append(vals)
+        table = numpy.array(rows, dtype=dtype).reshape(len(rows), len(dicts))
+        return names, tuple(table.T.copy())
+
+    names = list(_dictzip_keys(dicts, fill))
+    return names, tuple(
+        numpy.fromiter(
+            (dct.get(name, default) for name in names), dtype=dtype, count=len(names)
+        )
+        for dct in dicts
+    )
+
+
+def flat_dict(dct, sep=None, base=()):
+    """
+    Flats a nested dictionary into a single dictionary with key that is either a tuple or joint with `sep` (if given).
+    The nested dictionaries are visited with an explicit stack (no recursion) and the key prefix
+    of each level is computed once and reused for all its entries.
+    """
+    if sep is not None:
+        base = sep.join(base) + sep if base else ""
+    ismap = {}  # caching isinstance(val, Mapping) by type
+    stack = [(base, iter(items(dct)))]
+    while stack:
+        prefix, entries = stack[-1]
+        for key, val in entries:
+            key = prefix + (key,) if sep is None else prefix + key
+            cls = type(val)
+            if cls not in ismap:
+                ismap[cls] = isinstance(val, Mapping)
+            if ismap[cls]:
+                stack.append((key if sep is None else key + sep, iter(items(val))))
+                break
             yield key, val
+        else:
+            stack.pop()
 
 
 def nest_dict(dct, sep=None):
-    "Turns a dictionary into a nested dictionary splitting the key that is either a tuple or using `sep` (if given)"
+    """
+    Turns a dictionary into a nested dictionary splitting the key that is either a tuple or using `sep` (if given).
+    The nested dictionaries are cached by key prefix, such that each prefix is walked only once.
+    """
     out = {}
+    nodes = {}
     for key, val in items(dct):
         if sep is not None:
-            key = key.split(sep)
-        tmp = out
-        for part in key[:-1]:
-            tmp.setdefault(part, {})
-            tmp = tmp[part]
-        tmp[key[-1]] = val
+            head, found, key = key.rpartition(sep)
+            parts = head.split(sep) if found else ()
+        else:
+            parts, key = tuple(key[:-1]), key[-1]
+            head = parts
+        node = nodes.get(head) if parts else out
+        if node is None:
+            node = out
+            for part in parts:
+                node = node.setdefault(part, {})
+            nodes[head] = node
+        old = node.get(key) if isinstance(node, dict) else None
+        node[key] = val
+        if isinstance(old, dict):
+            # a leaf replaced a sub-dictionary, the cached nodes may be detached
+            nodes.clear()
     return out
 
 
 def allclose(left, right, **kwargs):
-    "Applies isclose to elements of iterable objects recursively"
+    """
+    Applies isclose to elements of iterable objects recursively.
+    If numpy is available, all the numerical values and arrays are compared at once.
+    """
+    pairs = []
+    if not _leaf_pairs(left, right, pairs):
+        return False
+    if isinstance(numpy, Exception):
+        return all((isclose(*pair, **kwargs) for pair in pairs))
+
+    lefts, rights, arrays = [], [], []
+    for pair in pairs:
+        if _is_scalar(pair[0]) and _is_scalar(pair[1]):
+            lefts.append(pair[0])
+            rights.append(pair[1])
+            continue
+        if _is_numeric_array(pair[0]) or _is_numeric_array(pair[1]):
+            converted = tuple(map(numpy.asarray, pair))
+            if not all(map(_is_numeric_array, converted)):
+                return False
+            # same shape or a scalar (see _leaf_pairs)
+            arrays.append(numpy.broadcast_arrays(*converted))
+            continue
+        # e.g. strings or integers too large for numpy
+        if not isclose(*pair, **kwargs):
+            return False
+    if lefts:
+        arrays.append((numpy.array(lefts), numpy.array(rights)))
+    if not arrays:
+        return True
+    left = numpy.concatenate([numpy.ravel(pair[0]) for pair in arrays])
+    right = numpy.concatenate([numpy.ravel(pair[1]) for pair in arrays])
+    return _isclose_arrays(left, right, **kwargs).all()
+
+
+_SCALARS = (bool, int, float, complex)
+
+
+def _is_scalar(val):
+    "Whether val is a number that numpy can represent"
+    if type(val) is int:  # pylint: disable=unidiomatic-typecheck
+        return -(2**63) <= val < 2**63
+    return type(val) in _SCALARS or isinstance(val, numpy.number)
+
+
+def _same_shape_or_scalar(left, right):
+    "Whether left and right have the same shape or one of them is a scalar"
+    try:
+        lshape, rshape = numpy.shape(left), numpy.shape(right)
+    except ValueError:
+        # e.g. ragged lists
+        return False
+    return lshape == rshape or not lshape or not rshape
+
+
+def _leaf_pairs(left, right, out):
+    """
+    Appends to out the pairs of non-iterable elements (or numerical arrays) to compare.
+    Returns False if the structures of left and right do not match.
+    """
+    if _is_numeric_array(left) or _is_numeric_array(right):
+        if not isinstance(left, Mapping) and not isinstance(right, Mapping):
+            if _same_shape_or_scalar(left, right):
+                out.append((left, right))
+                return True
+            # otherwise compared along the first axis as other iterables
     if not isiterable(left, exclude_str=True) and not isiterable(
         right, exclude_str=True
     ):
-        return isclose(left, right, **kwargs)
+        out.append((left, right))
+        return True
     if not isiterable(left, exclude_str=True):
         left = [left] * len(right)
     if not isiterable(right, exclude_str=True):
@@ -142,13 +397,15 @@ def allclose(left, right, **kwargs):
             pairs = dictzip(left, right, values_only=True)
     else:
         pairs = zip(left, right)
-    return all((allclose(*pair, **kwargs) for pair in pairs))
+    return all((_leaf_pairs(*pair, out) for pair in pairs))
 
 
 def compact_indexes(ids):
     """
     Returns a list of ranges or integers
-    as they occur sequentially in the list
+    as they occur sequentially in the list.
+    Iterators are consumed lazily, i.e. in constant memory,
+    while numpy arrays are compacted at once (see compact_ranges).
 
     Examples
     --------
@@ -156,12 +413,22 @@ def compact_indexes(ids):
     [1, range(2, 7, 2), 7, range(8, 13, 2), 13]
     """
 
-    if not isiterable(ids, int):
+    if not isinstance(numpy, Exception) and isinstance(ids, numpy.ndarray):
+        for start, stop, step in compact_ranges(ids).tolist():
+            if stop - start == step:
+                yield start
+            else:
+                yield range(start, stop, step)
+        return
+
+    if not isiterable(ids):
         raise TypeError("compact_indexes requires a list of integers")
 
     tmp = []
     step = 0
     for idx in ids:
+        if not isinstance(idx, Integral):
+            raise TypeError("compact_indexes requires a list of integers")
         if len(tmp) < 2:
             tmp.append(idx)
         else:
@@ -184,3 +451,341 @@ def compact_indexes(ids):
         yield from tmp
     else:
         yield range(tmp[0], tmp[1] + (1 if step > 0 else -1), step)
+
+
+def compact_ranges(ids):
+    """
+    Vectorized version of compact_indexes for arrays of integers.
+    Returns an array of shape (n, 3) with (start, stop, step) of the ranges,
+    where single integers are stored as (idx, idx + 1, 1).
+
+    Examples
+    --------
+    >>> compact_ranges([1, 2, 4, 6, 7, 8, 10, 12, 13]).tolist()
+    [[1, 2, 1], [2, 7, 2], [7, 8, 1], [8, 13, 2], [13, 14, 1]]
+    """
+    ids = numpy.asarray(ids)
+    if ids.ndim != 1 or (ids.size and ids.dtype.kind not in "iu"):
+        raise TypeError("compact_ranges requires a list of integers")
+    ids = ids.astype(numpy.int64, copy=False)
+    if len(ids) < 2:
+        return numpy.stack([ids, ids + 1, numpy.ones_like(ids)], axis=1)
+
+    # Runs of equal steps between consecutive elements:
+    # the run k covers the elements from starts[k] to ends[k] (included)
+    diff = numpy.diff(ids)
+    starts = numpy.concatenate([[0], numpy.flatnonzero(diff[1:] != diff[:-1]) + 1])
+    ends = numpy.append(starts[1:], len(diff))
+    steps = diff[starts]
+    lengths = ends - starts
+
+    # As in compact_indexes, a run is processed from its start or from the next element
+    # if the previous run has been compacted into a range including its start.
+    # This offset is forced by runs of any length except two, where it toggles.
+    nonzero = steps != 0
+    toggle = nonzero & (lengths == 2)
+    forced = (nonzero & (lengths > 2)).astype(numpy.int64)
+    runs = numpy.arange(len(starts))
+    last = numpy.maximum.accumulate(numpy.where(toggle, -1, runs))
+    ntoggles = numpy.cumsum(toggle)
+    ntoggles -= numpy.where(last >= 0, ntoggles[last], 0)
+    after = numpy.where(last >= 0, forced[last], 0) ^ (ntoggles & 1)
+    offset = numpy.concatenate([[0], after[:-1]])
+
+    first = starts + offset
+    is_range = nonzero & (ends - first >= 2)
+    ranges = numpy.stack(
+        [
+            ids[first[is_range]],
+            ids[ends[is_range]] + numpy.sign(steps[is_range]),
+            steps[is_range],
+        ],
+        axis=1,
+    )
+
+    # All the other elements are singles
+    counts = numpy.where(is_range, 0, ends - first)
+    singles = numpy.repeat(first, counts)
+    singles += numpy.arange(len(singles)) - numpy.repeat(
+        numpy.cumsum(counts) - counts, counts
+    )
+    if not after[-1]:
+        singles = numpy.append(singles, len(ids) - 1)
+
+    position = numpy.concatenate([first[is_range], singles])
+    values = ids[singles]
+    singles = numpy.stack([values, values + 1, numpy.ones_like(values)], axis=1)
+    out = numpy.concatenate([ranges, singles])
+    return out[numpy.argsort(position, kind="stable")]
+
+
+class RangeSet(Set):
+    """
+    Set of integers stored as sorted and non-overlapping ranges, e.g. as returned by
+    compact_indexes. Membership costs O(log k) and length O(1), where k is the number
+    of ranges. Set operations cost O(k) when the result of overlapping ranges is again
+    a range. Otherwise (e.g. the union of multiples of 2 and 3, or the difference
+    between all the integers and the multiples of 3) the overlapping part has to be
+    split into pieces, costing O(n) in time and memory, where n is the number of
+    elements of the overlapping ranges.
+
+    Examples
+    --------
+    >>> RangeSet(compact_indexes([1, 2, 4, 6, 7, 8])) & RangeSet([range(0, 10, 2)])
+    RangeSet([range(2, 10, 2)])
+    """
+
+    def __init__(self, items=()):
+        if not isinstance(numpy, Exception) and isinstance(items, numpy.ndarray):
+            if items.ndim == 2:
+                items = (range(*row) for row in items.tolist())
+        ranges = sorted(
+            (rng for rng in map(_to_range, items) if rng), key=lambda rng: rng[0]
+        )
+        # Merging the clusters of overlapping ranges
+        out = []
+        cluster, end = [], None
+        for rng in ranges:
+            if cluster and rng[0] <= end:
+                cluster = _combine(cluster, [rng], "or")
+                end = max(end, rng[-1])
+            else:
+                out.extend(cluster)
+                cluster, end = [rng], rng[-1]
+        out.extend(cluster)
+        self._set_ranges(out)
+
+    def _set_ranges(self, ranges):
+        self._ranges = tuple(_join(ranges))
+        self._starts = [rng[0] for rng in self._ranges]
+        self._len = sum(map(len, self._ranges))
+
+    @classmethod
+    def _from_ranges(cls, ranges):
+        "Returns a RangeSet from sorted and non-overlapping ranges"
+        out = cls.__new__(cls)
+        out._set_ranges(ranges)
+        return out
+
+    @property
+    def ranges(self):
+        "The sorted and non-overlapping ranges of the set"
+        return self._ranges
+
+    def __contains__(self, val):
+        idx = bisect_right(self._starts, val) - 1
+        return idx >= 0 and val in self._ranges[idx]
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return chain.from_iterable(self._ranges)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({list(self._ranges)})"
+
+    def __eq__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        if not isinstance(other, RangeSet):
+            other = RangeSet(other)
+        return len(self) == len(other) and not self - other
+
+    __hash__ = None
+
+    def _operation(self, other, opr):
+        if not isinstance(other, RangeSet):
+            if not isiterable(other):
+                return NotImplemented
+            other = RangeSet(other)
+        return self._from_ranges(_combine(self._ranges, other.ranges, opr))
+
+    def __or__(self, other):
+        return self._operation(other, "or")
+
+    def __and__(self, other):
+        return self._operation(other, "and")
+
+    def __sub__(self, other):
+        return self._operation(other, "sub")
+
+    __ror__ = __or__
+    __rand__ = __and__
+    union = __or__
+    intersection = __and__
+    difference = __sub__
+
+    def to_array(self, dtype=None, out=None):
+        "Returns the sorted elements as a numpy array, optionally filling `out`"
+        starts = numpy.array([rng.start for rng in self._ranges], dtype=numpy.int64)
+        steps = numpy.array([rng.step for rng in self._ranges], dtype=numpy.int64)
+        lengths = numpy.array(list(map(len, self._ranges)), dtype=numpy.int64)
+        if out is None:
+            out = numpy.empty(len(self), dtype=dtype or numpy.int64)
+        elif len(out) != len(self):
+            raise ValueError(f"Output of length {len(out)} instead of {len(self)}")
+        offsets = numpy.arange(len(self)) - numpy.repeat(
+            numpy.cumsum(lengths) - lengths, lengths
+        )
+        out[:] = numpy.repeat(starts, lengths) + offsets * numpy.repeat(steps, lengths)
+        return out
+
+
+def _to_range(val):
+    "Converts an integer or a range to a range with positive step"
+    if isinstance(val, range):
+        return val if val.step > 0 else val[::-1]
+    if isinstance(val, Integral):
+        return range(val, val + 1)
+    raise TypeError(f"Expected integer or range, got {type(val)}")
+
+
+def _inverse(num, mod):
+    "Modular inverse of num (coprime with mod) via the extended Euclidean algorithm"
+    old, new = 0, 1
+    rem, num = mod, num % mod
+    while num:
+        quot = rem // num
+        old, new = new, old - quot * new
+        rem, num = num, rem - quot * num
+    return old % mod
+
+
+def _clip(rng, low, high):
+    "Restricts the range to the elements in [low, high)"
+    if not rng:
+        return rng
+    start = rng.start + max(-(-(low - rng.start) // rng.step), 0) * rng.step
+    return range(start, min(rng.stop, high), rng.step)
+
+
+def _issubrange(small, big):
+    "Whether all the elements of small are in big"
+    if not small:
+        return True
+    if small[0] not in big or small[-1] not in big:
+        return False
+    return len(small) == 1 or small.step % big.step == 0
+
+
+def _intersect(left, right):
+    "Intersection of two ranges with positive steps (Chinese remainder theorem)"
+    if not left or not right:
+        return range(0)
+    div = gcd(left.step, right.step)
+    shift = right.start - left.start
+    if shift % div:
+        return range(0)
+    mod = right.step // div
+    times = (shift // div) * _inverse(left.step // div, mod) % mod
+    step = left.step * mod
+    low = max(left.start, right.start)
+    first = low + (left.start + left.step * times - low) % step
+    return range(first, min(left[-1], right[-1]) + 1, step)
+
+
+def _combine_pair(left, right, opr):
+    "Set operation between two ranges within the same segment"
+    if opr == "and":
+        return [_intersect(left, right)]
+    if opr == "or":
+        return _union(left, right)
+    if opr == "sub":
+        return _difference(left, right)
+    raise ValueError(f"Unknown operation {opr}")
+
+
+def _union(left, right):
+    "Union of two ranges with positive steps"
+    if _issubrange(right, left):
+        return [left]
+    if _issubrange(left, right):
+        return [right]
+    # Both are contained in the progression with the gcd of the steps and offset
+    step = gcd(
+        gcd(left.step if len(left) > 1 else 0, right.step if len(right) > 1 else 0),
+        right[0] - left[0],
+    )
+    merged = range(min(left[0], right[0]), max(left[-1], right[-1]) + 1, step)
+    if len(merged) == len(left) + len(right) - len(_intersect(left, right)):
+        return [merged]
+    # merging the two sorted progressions, O(len(left) + len(right))
+    if not isinstance(numpy, Exception) and -(2**63) <= merged[0] < merged[-1] < 2**63:
+        merged = numpy.concatenate(
+            [
+                numpy.arange(left.start, left.stop, left.step),
+                numpy.arange(right.start, right.stop, right.step),
+            ]
+        )
+        merged.sort(kind="stable")  # merging two sorted runs
+        merged = merged[numpy.concatenate([[True], merged[1:] != merged[:-1]])]
+        return [range(*row) for row in compact_ranges(merged).tolist()]
+    merged = (val for val, _ in groupby(merge(left, right)))
+    return list(map(_to_range, compact_indexes(merged)))
+
+
+def _difference(left, right):
+    "Difference of two ranges with positive steps"
+    common = _intersect(left, right)
+    if not common:
+        return [left]
+    if len(common) == len(left):
+        return []
+    before = _clip(left, left[0], common[0])
+    after = _clip(left, common[-1] + 1, left[-1] + 1)
+    # common.step is a multiple of left.step
+    ratio = common.step // left.step if len(common) > 1 else 1
+    if ratio == 1:
+        middle = []
+    elif ratio == 2:
+        middle = [range(common[0] + left.step, common[-1], common.step)]
+    else:
+        # the elements between two consecutive common ones
+        middle = (
+            range(val + left.step, val + common.step, left.step) for val in common[:-1]
+        )
+    return [before, *middle, after]
+
+
+def _combine(left, right, opr):
+    """
+    Set operation between two lists of sorted and non-overlapping ranges.
+    The line is split in segments between the bounds of all the ranges,
+    such that in each segment every list has at most one range.
+    """
+    bounds = sorted(
+        {rng[0] for rng in chain(left, right)}
+        | {rng[-1] + 1 for rng in chain(left, right)}
+    )
+    out = []
+    idxs = [0, 0]
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        parts = []
+        for i, ranges in enumerate((left, right)):
+            while idxs[i] < len(ranges) and ranges[idxs[i]][-1] < low:
+                idxs[i] += 1
+            if idxs[i] < len(ranges):
+                parts.append(_clip(ranges[idxs[i]], low, high))
+            else:
+                parts.append(range(0))
+        out.extend(rng for rng in _combine_pair(*parts, opr) if rng)
+    return out
+
+
+def _join(ranges):
+    "Joins consecutive ranges that continue each other"
+    out = []
+    for rng in ranges:
+        if out:
+            prev = out[-1]
+            gap = rng.start - prev[-1]
+            if (
+                (rng.step == gap or len(rng) == 1)
+                and (prev.step == gap or len(prev) == 1)
+                and (gap == 1 or len(prev) > 1 or len(rng) > 1)
+            ):
+                out[-1] = range(prev.start, rng[-1] + 1, gap)
+                continue
+        out.append(rng)
+    return out
@@ -6,56 +6,144 @@ __all__ = [
     "prod",
     "sign",
     "iscomplex",
+    "is_complex_dtype",
     "isclose",
     "factors",
     "prime_factors",
+    "is_prime",
+    "divisors",
+    "divisor_pairs",
+    "factorizations_into",
+    "best_grid",
+    "FactorTable",
+    "factor_table",
 ]
 
+import cmath
 import math
+import operator
+import threading
 import warnings
-from functools import reduce
+from itertools import compress, count
+from types import SimpleNamespace
+from array import array
+from collections import Counter
+from functools import reduce, lru_cache
 from .numpy import numpy
 
 try:
-    from math import prod
+    from math import prod as _prod
 except ImportError:
 
-    def prod(arr):
+    def _prod(arr, start=1):
         "Returns the product of the elements"
-        return reduce((lambda x, y: x * y), arr, 1)
+        return reduce((lambda x, y: x * y), arr, start)
+
+
+try:
+    from math import isqrt
+except ImportError:
+
+    def isqrt(num):
+        "Returns the integer square root of num"
+        if num < 0:
+            raise ValueError("isqrt() argument must be nonnegative")
+        val, new = num, (num + 1) // 2
+        while new < val:
+            val, new = new, (new + num // new) // 2
+        return val
+
+
+def _is_array(arr):
+    "Whether arr is a numpy array"
+    return not isinstance(numpy, Exception) and isinstance(arr, numpy.ndarray)
+
+
+def prod(arr, axis=None, start=1):
+    """
+    Returns the product of the elements.
+    Numpy arrays, or any array-like if `axis` is given (e.g. a list of shapes with `axis=-1`),
+    are reduced with numpy along the axis (by default the first one, as iterating).
+    Integers that would overflow int64 are multiplied exactly as Python integers.
+    """
+    if axis is None and not _is_array(arr):
+        return _prod(arr, start=start)
+    arr = numpy.asarray(arr)
+    if axis is None:
+        axis = 0
+    if arr.dtype.kind in "biu":
+        # estimating the magnitude for detecting overflows
+        est = numpy.prod(arr, axis=axis, dtype=float) * float(start)
+        if (abs(est) >= 2**62).any():
+            arr = arr.astype(object)
+        else:
+            arr = arr.astype(numpy.int64, copy=False)
+    out = numpy.prod(arr, axis=axis)
+    if start != 1:
+        out = out * start
+    return out
 
 
 def sign(num):
-    "Sign of a number"
+    """
+    Sign of a number (+1 for zero).
+    For numpy arrays, lists and tuples returns the array of signs.
+    """
+    if _is_array(num) or isinstance(num, (list, tuple)):
+        return numpy.where(numpy.asarray(num) < 0, -1, 1)
     if num < 0:
         return -1
     return +1
 
 
-def iscomplex(val):
-    "If val is complex"
+def is_complex_dtype(dtype):
+    "If dtype (a Python type or a numpy dtype) is complex"
+    if isinstance(dtype, type) and issubclass(dtype, complex):
+        return True
+    if isinstance(numpy, Exception):
+        return False
     try:
-        return numpy.iscomplex(val).any()
-    except AttributeError:
-        return isinstance(val, complex)
+        return numpy.dtype(dtype).kind == "c"
+    except TypeError:
+        return False
+
+
+def iscomplex(val, scan=False):
+    """
+    If val is complex. The type (or dtype) of val is used, so the answer is immediate
+    also for arrays, while lists and tuples are checked element by element.
+    If scan, val is complex only if any element has non-zero imaginary part.
+    """
+    if scan:
+        try:
+            return numpy.iscomplex(val).any()
+        except AttributeError:
+            return isinstance(val, complex) and val.imag != 0
+    if isinstance(val, complex):
+        return True
+    dtype = getattr(val, "dtype", None)
+    if dtype is not None:
+        return is_complex_dtype(dtype)
+    if isinstance(val, (list, tuple)):
+        return any(map(iscomplex, val))
+    return False
 
 
 def isclose(left, right, warn_tol=None, **kwargs):
     """
     If warn_tol is not None and the relative tolerance is larger than rel_tol (default 1e-9)
-    but smaller than warn_tol (default 1%), then True is returned and a warning is raised
+    but smaller than warn_tol (default 1%), then True is returned and a warning is raised.
+    For numerical numpy arrays, the array of the elementwise comparison is returned.
     """
+    if _is_numeric_array(left) or _is_numeric_array(right):
+        return _isclose_arrays(
+            numpy.asarray(left), numpy.asarray(right), warn_tol=warn_tol, **kwargs
+        )
     try:
-        if iscomplex(left) or iscomplex(right):
-            if "rel_tol" in kwargs:
-                left = 1 + 2 * abs(left - right) / abs(left + right)
-                right = 1
-            else:
-                left = abs(left - right)
-                right = 0
-        if math.isclose(left, right, **kwargs):
+        close = cmath.isclose if iscomplex(left) or iscomplex(right) else math.isclose
+        if close(left, right, **kwargs):
             return True
-        if warn_tol not in [None, 0] and math.isclose(left, right, rel_tol=warn_tol):
+        if warn_tol not in [None, 0] and close(left, right, rel_tol=warn_tol):
             warnings.warn(f"accepting {left} close to {right}")
             return True
     except TypeError:
@@ -63,81 +151,356 @@ def isclose(left, right, warn_tol=None, **kwargs):
     return left == right
 
 
-def factors(num):
-    "Returns the list of factors of n"
-    assert isinstance(num, int), "Num must be int"
-    for i in range(2, num // 2):
-        if num % i == 0:
-            yield i
-    yield num
+def _is_numeric_array(val):
+    "Whether val is a numpy array of numbers (or booleans)"
+    return _is_array(val) and val.dtype.kind in "biufc"
 
 
-def prime_factors(num):
-    "Returns the list of prime factors of n"
-    itr = iter(PRIMES)
-    cur = next(itr)
-    stop = int(num**0.5) + 1
-    while num > 1 and cur < stop:
-        while num % cur == 0:
-            yield cur
-            num //= cur
-
-        # Looping first over the known prime numbers
-        try:
-            cur = next(itr)
-        # then proceeding only with the odd numbers
-        except StopIteration:
-            cur += 2
+def _isclose_arrays(left, right, rel_tol=1e-9, abs_tol=0.0, warn_tol=None):
+    "Vectorized version of isclose for arrays, as cmath.isclose applied elementwise"
+    if left.dtype.kind == "b":
+        left = left.astype(int)
+    if right.dtype.kind == "b":
+        right = right.astype(int)
+    # inf - inf gives nan, which is never close (equal infinities are checked apart)
+    with numpy.errstate(invalid="ignore"):
+        diff = abs(left - right)
+    scale = numpy.maximum(abs(left), abs(right))
 
-    if num > 1:
+    def close(tol):
+        return (left == right) | (
+            numpy.isfinite(diff) & (diff <= numpy.maximum(tol * scale, abs_tol))
+        )
+
+    out = close(rel_tol)
+    if warn_tol not in [None, 0] and not out.all():
+        accepted = close(warn_tol) & ~out
+        if accepted.any():
+            warnings.warn(
+                f"accepting values with max difference {diff[accepted].max()}"
+            )
+            out |= accepted
+    return out
+
+
+def factors(num, sort=True):
+    """
+    Returns the list of factors of n larger than one (n included).
+    The factors are computed from the prime factorization and are sorted if `sort`.
+    """
+    num = operator.index(num)
+    if num <= 1:
         yield num
+    elif sort:
+        yield from divisors(num)[1:]
+    else:
+        yield from _divisors(num)[1:]
+
+
+def _divisors(num):
+    "Returns the unsorted list of divisors of num from its prime factorization"
+    divs = [1]
+    for prime, exp in Counter(prime_factors(num)).items():
+        divs = [div * prime**k for div in divs for k in range(exp + 1)]
+    return divs
+
+
+@lru_cache(maxsize=2**10)
+def divisors(num):
+    "Returns the sorted tuple of all the divisors of n (1 and n included). Cached."
+    num = operator.index(num)
+    if num < 1:
+        raise ValueError(f"Divisors are defined for positive integers, got {num}")
+    return tuple(sorted(_divisors(num)))
+
+
+def divisor_pairs(num):
+    "Returns the pairs of divisors (a, b) with a <= b and a * b = n"
+    for div in divisors(num):
+        if div * div > num:
+            return
+        yield div, num // div
+
+
+def factorizations_into(num, parts, ordered=True):
+    """
+    Returns all the ways of writing n as product of `parts` factors.
+    If not `ordered`, only the sorted tuples are returned, i.e. the order does not count.
+
+    Examples
+    --------
+    >>> list(factorizations_into(12, 2, ordered=False))
+    [(1, 12), (2, 6), (3, 4)]
+    """
+    if parts < 1:
+        raise ValueError("parts must be a positive number")
+    if operator.index(num) < 1:
+        raise ValueError(f"num must be a positive integer, got {num}")
+    yield from _factorizations_into(num, parts, ordered, 1)
+
+
+def _factorizations_into(num, parts, ordered, start):
+    if parts == 1:
+        if num >= start:
+            yield (num,)
+        return
+    for div in divisors(num):
+        if not ordered and div**parts > num:
+            return
+        if div < start:
+            continue
+        for tail in _factorizations_into(
+            num // div, parts - 1, ordered, 1 if ordered else div
+        ):
+            yield (div,) + tail
+
+
+class FactorTable:
+    """
+    Table of the smallest prime factor of all the integers up to a limit,
+    for factorizing any of them in O(log n).
+    Only the factors of composite numbers are stored, i.e. at most sqrt(limit),
+    so two bytes per number suffice up to 2**32.
+    """
+
+    def __init__(self, limit):
+        self.limit = operator.index(limit)
+        root = isqrt(max(self.limit, 0))
+        typecode = next(
+            code for code in "HIL" if root < 2 ** (8 * array(code).itemsize)
+        )
+        if isinstance(numpy, Exception):
+            table = array(typecode, bytes(array(typecode).itemsize * (self.limit + 1)))
+            for prime in range(2, root + 1):
+                if not table[prime]:
+                    for idx in range(prime * prime, self.limit + 1, prime):
+                        if not table[idx]:
+                            table[idx] = prime
+        else:
+            dtype = numpy.dtype(f"=u{array(typecode).itemsize}")
+            values = numpy.zeros(self.limit + 1, dtype=dtype)
+            for prime in range(2, root + 1):
+                if not values[prime]:
+                    view = values[prime * prime :: prime]
+                    view[view == 0] = prime
+            table = array(typecode)
+            table.frombytes(values.tobytes())
+        self.table = table
+
+    def __len__(self):
+        return self.limit + 1
+
+    def _check(self, num):
+        num = operator.index(num)
+        if not 0 <= num <= self.limit:
+            raise ValueError(f"{num} out of the range of the table [0, {self.limit}]")
+        return num
+
+    def smallest_prime_factor(self, num):
+        "Returns the smallest prime factor of n (n itself if prime)"
+        num = self._check(num)
+        return self.table[num] or num
+
+    def is_prime(self, num):
+        "Returns if n is prime"
+        return self._check(num) > 1 and not self.table[num]
+
+    def prime_factors(self, num):
+        "Returns the list of prime factors of n in ascending order"
+        num = self._check(num)
+        table = self.table
+        out = []
+        while num > 1:
+            fac = table[num] or num
+            out.append(fac)
+            num //= fac
+        return out
+
+    __getitem__ = prime_factors
+
+
+_FACTOR_TABLE = SimpleNamespace(table=None)
+
+
+def factor_table(limit):
+    "Returns a FactorTable up to at least limit. The table is shared among calls."
+    table = _FACTOR_TABLE.table
+    if table is None or table.limit < limit:
+        table = FactorTable(limit)
+        _FACTOR_TABLE.table = table
+    return table
+
+
+def best_grid(lattice_shape, nprocs, min_local=1):
+    """
+    Returns the grid of processes for splitting the lattice among `nprocs` processes
+    that minimizes the halo surface, i.e. the communication volume per process.
+    The lattice must be divisible by the grid and the local lattice must have
+    at least `min_local` sites per dimension. Among grids with the same halo,
+    the ones splitting fewer dimensions (i.e. with fewer neighbours) are preferred.
+    Results are cached.
+
+    Examples
+    --------
+    >>> best_grid((8, 8, 8, 16), 16)
+    (1, 1, 2, 8)
+    """
+    return _best_grid(tuple(map(operator.index, lattice_shape)), nprocs, min_local)
+
+
+@lru_cache(maxsize=2**10)
+def _best_grid(lattice_shape, nprocs, min_local):
+    best = None
+    for grid in _grids(lattice_shape, nprocs, min_local):
+        local = tuple(size // procs for size, procs in zip(lattice_shape, grid))
+        volume = prod(local)
+        halo = sum(2 * volume // size for size, procs in zip(local, grid) if procs > 1)
+        key = (halo, len(grid) - grid.count(1), grid)
+        if best is None or key < best:
+            best = key
+    if best is None:
+        raise ValueError(f"Lattice {lattice_shape} cannot be split in {nprocs} parts")
+    return best[-1]
+
 
+def _grids(lattice_shape, nprocs, min_local):
+    "Returns the grids that divide the lattice in nprocs parts"
+    if not lattice_shape:
+        if nprocs == 1:
+            yield ()
+        return
+    size, *rest = lattice_shape
+    for procs in divisors(math.gcd(size, nprocs)):
+        if size // procs < min_local:
+            break
+        for tail in _grids(rest, nprocs // procs, min_local):
+            yield (procs,) + tail
 
-PRIMES = (
-    2,
-    3,
-    5,
-    7,
-    11,
-    13,
-    17,
-    19,
-    23,
-    29,
-    31,
-    37,
-    41,
-    43,
-    47,
-    53,
-    59,
-    61,
-    67,
-    71,
-    73,
-    79,
-    83,
-    89,
-    97,
-    101,
-    103,
-    107,
-    109,
-    113,
-    127,
-    131,
-    137,
-    139,
-    149,
-    151,
-    157,
-    163,
-    167,
-    173,
-    179,
-    181,
-    191,
-    193,
-    197,
-    199,
-)
+
+class _PrimeSieve:
+    "Table of primes lazily extended via a segmented sieve"
+
+    def __init__(self):
+        self.limit = 2  # all the primes below limit are known
+        self.primes = []
+        self.lock = threading.Lock()
+
+    def extend(self, limit):
+        "Extends the table to all the primes below limit"
+        if limit <= self.limit:
+            return
+        with self.lock:
+            self._extend(limit)
+
+    def _extend(self, limit):
+        if limit <= self.limit:
+            return
+        # doubling for amortizing the cost of repeated extensions
+        limit = max(limit, 2 * self.limit)
+        root = isqrt(limit - 1) + 1
+        if root > self.limit:
+            self._extend(root)
+        low, size = self.limit, limit - self.limit
+        segment = bytearray(b"\1") * size
+        for prime in self.primes:
+            if prime * prime >= limit:
+                break
+            start = max(prime * prime, -(-low // prime) * prime) - low
+            segment[start::prime] = bytes(len(range(start, size, prime)))
+        self.primes.extend(compress(range(low, limit), segment))
+        self.limit = limit
+
+
+SIEVE = _PrimeSieve()
+
+# Limit of the trial division, larger factors are found with Pollard's rho
+TRIAL_LIMIT = 2**10
+
+# Miller-Rabin with these bases is deterministic for n < 3.3e24
+MR_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+
+
+def is_prime(num):
+    "Returns if num is prime (Miller-Rabin test)"
+    if num < 2:
+        return False
+    for prime in MR_BASES:
+        if num % prime == 0:
+            return num == prime
+    odd, exp = num - 1, 0
+    while odd % 2 == 0:
+        odd //= 2
+        exp += 1
+    for base in MR_BASES:
+        val = pow(base, odd, num)
+        if val in (1, num - 1):
+            continue
+        for _ in range(exp - 1):
+            val = val * val % num
+            if val == num - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _pollard_rho(num):
+    "Returns a non-trivial factor of a composite num (Brent's variant)"
+    if num % 2 == 0:
+        return 2
+    for const in count(1):
+        val, step, acc, fac = 2, 1, 1, 1
+        start = saved = val
+        while fac == 1:
+            start = val
+            for _ in range(step):
+                val = (val * val + const) % num
+            done = 0
+            while done < step and fac == 1:
+                saved = val
+                for _ in range(min(128, step - done)):
+                    val = (val * val + const) % num
+                    acc = acc * abs(start - val) % num
+                fac = math.gcd(acc, num)
+                done += 128
+            step *= 2
+        if fac == num:
+            fac = 1
+            while fac == 1:
+                saved = (saved * saved + const) % num
+                fac = math.gcd(abs(start - saved), num)
+        if fac != num:
+            return fac
+    return num
+
+
+def _large_factors(num):
+    "Returns the prime factors of num, that has no small factors"
+    if num == 1:
+        return []
+    if is_prime(num):
+        return [num]
+    fac = _pollard_rho(num)
+    return _large_factors(fac) + _large_factors(num // fac)
+
+
+def prime_factors(num):
+    """
+    Returns the list of prime factors of n in ascending order.
+    Small factors are found by trial division over a shared table of primes,
+    large ones via Pollard's rho and Miller-Rabin.
+    """
+    num = operator.index(num)
+    stop = isqrt(max(num, 0)) + 1
+    SIEVE.extend(min(stop, TRIAL_LIMIT))
+    for prime in SIEVE.primes:
+        if num == 1 or prime >= stop or prime >= TRIAL_LIMIT:
+            break
+        if num % prime == 0:
+            while num % prime == 0:
+                yield prime
+                num //= prime
+            stop = isqrt(num) + 1
+
+    if num > 1:
+        yield from sorted(_large_factors(num))
@@ -8,8 +8,11 @@ __all__ = [
     "gamma_matrices",
     "su_generators",
     "requires_numpy",
+    "ArrayDict",
 ]
 
+import operator
+from collections.abc import Mapping, MutableMapping
 from .extensions import lazy_import, raiseif
 
 try:
@@ -86,3 +89,214 @@ def su_generators(ncol=3):
         mat = numpy.zeros((ncol, ncol), dtype=complex)
         mat[dia, dia] = data
         yield mat * norm(mat)
+
+
+class _KeyIndex(tuple):
+    "Tuple of keys with their positions, shared among ArrayDicts"
+
+    def __init__(self, keys):
+        super().__init__()
+        self.positions = {key: pos for pos, key in enumerate(self)}
+        if len(self.positions) != len(self):
+            raise ValueError("Repeated keys")
+
+    def take(self, keys):
+        "Returns the positions of the given keys"
+        try:
+            return [self.positions[key] for key in keys]
+        except KeyError as err:
+            raise KeyError(f"{err.args[0]} not in keys") from err
+
+
+class ArrayDict(MutableMapping):
+    """
+    A numerical dictionary, like ndict, with the values stored in a numpy array.
+    The values are along the first axis of the array and the keys are kept in an index
+    shared with the results of the operations, such that arithmetic between
+    ArrayDicts with the same keys is a single ufunc call on the arrays.
+    As for ndict, keys of the right operand must be present in the left one.
+    The values must have all the same shape.
+    """
+
+    @requires_numpy
+    def __init__(self, data=(), dtype=None):
+        if isinstance(data, ArrayDict):
+            self._keys, self._values = data._keys, numpy.array(
+                data._values, dtype=dtype
+            )
+            return
+        if isinstance(data, Mapping):
+            data = data.items()
+        data = tuple(data)
+        self._keys = _KeyIndex(key for key, _ in data)
+        self._values = numpy.array([val for _, val in data], dtype=dtype)
+
+    @classmethod
+    @requires_numpy
+    def from_array(cls, keys, values):
+        "Creates an ArrayDict from the keys and the array of values (not copied)"
+        out = cls.__new__(cls)
+        out._keys = keys if isinstance(keys, _KeyIndex) else _KeyIndex(keys)
+        out._values = numpy.asarray(values)
+        if len(out._values) != len(out._keys):
+            raise ValueError("Keys and values have different length")
+        return out
+
+    @property
+    def array(self):
+        "The array of the values"
+        return self._values
+
+    def __array__(self, dtype=None, copy=None):
+        return numpy.asarray(self._values, dtype=dtype)
+
+    def __getitem__(self, key):
+        return self._values[self._keys.positions[key]]
+
+    def __setitem__(self, key, val):
+        if key in self._keys.positions:
+            self._values[self._keys.positions[key]] = val
+            return
+        self._keys = _KeyIndex(self._keys + (key,))
+        if len(self._values):
+            self._values = numpy.concatenate([self._values, [val]])
+        else:
+            # the shape of the values is given by the first one
+            self._values = numpy.array([val])
+
+    def __delitem__(self, key):
+        pos = self._keys.positions[key]
+        self._keys = _KeyIndex(self._keys[:pos] + self._keys[pos + 1 :])
+        self._values = numpy.delete(self._values, pos, axis=0)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys.positions
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(zip(self._keys, self._values.tolist()))})"
+
+    def copy(self):
+        "Returns a copy sharing the keys"
+        return self.from_array(self._keys, self._values.copy())
+
+    def _operand(self, other):
+        "Returns the positions (None for all) and the values of the other operand"
+        if isinstance(other, ArrayDict):
+            if other._keys is self._keys or other._keys == self._keys:
+                return None, other._values
+            return self._keys.take(other._keys), other._values
+        if isinstance(other, Mapping):
+            return self._keys.take(other.keys()), numpy.array(list(other.values()))
+        return None, other
+
+    def __ufunc__(self, other, fnc, reverse=False):
+        pos, other = self._operand(other)
+        if reverse:
+            if pos is not None and len(pos) != len(self):
+                # the keys of the right operand must be in the left one
+                missing = set(self._keys) - set(self._keys[idx] for idx in pos)
+                raise KeyError(f"{missing} not in keys")
+            fnc = _reversed(fnc)
+        if pos is None:
+            return self.from_array(self._keys, fnc(self._values, other))
+        res = fnc(self._values[pos], other)
+        out = self._values.astype(numpy.result_type(self._values, res))
+        out[pos] = res
+        return self.from_array(self._keys, out)
+
+    def __iufunc__(self, other, ufunc):
+        pos, other = self._operand(other)
+        dtype = numpy.result_type(self._values, other)
+        if ufunc is numpy.true_divide:
+            dtype = numpy.result_type(dtype, 1.0)
+        if dtype != self._values.dtype:
+            # upcasting, e.g. ints divided by ints
+            self._values = self._values.astype(dtype)
+        if pos is None:
+            ufunc(self._values, other, out=self._values)
+        else:
+            ufunc.at(self._values, pos, other)
+        return self
+
+    def __add__(self, other):
+        return self.__ufunc__(other, operator.add)
+
+    def __radd__(self, other):
+        return self.__ufunc__(other, operator.add, reverse=True)
+
+    def __iadd__(self, other):
+        return self.__iufunc__(other, numpy.add)
+
+    def __sub__(self, other):
+        return self.__ufunc__(other, operator.sub)
+
+    def __rsub__(self, other):
+        return self.__ufunc__(other, operator.sub, reverse=True)
+
+    def __isub__(self, other):
+        return self.__iufunc__(other, numpy.subtract)
+
+    def __mul__(self, other):
+        return self.__ufunc__(other, operator.mul)
+
+    def __rmul__(self, other):
+        return self.__ufunc__(other, operator.mul, reverse=True)
+
+    def __imul__(self, other):
+        return self.__iufunc__(other, numpy.multiply)
+
+    def __truediv__(self, other):
+        return self.__ufunc__(other, operator.truediv)
+
+    def __rtruediv__(self, other):
+        return self.__ufunc__(other, operator.truediv, reverse=True)
+
+    def __itruediv__(self, other):
+        return self.__iufunc__(other, numpy.true_divide)
+
+    def __pow__(self, other):
+        return self.__ufunc__(other, operator.pow)
+
+    def __ipow__(self, other):
+        return self.__iufunc__(other, numpy.power)
+
+    def __neg__(self):
+        return self.from_array(self._keys, -self._values)
+
+    @classmethod
+    def sum(cls, dicts, start=None):
+        "Sums an iterable of ArrayDicts accumulating in-place"
+        out = None if start is None else cls(start)
+        for dct in dicts:
+            if out is None:
+                out = cls(dct)
+            else:
+                out += dct
+        if out is None:
+            raise ValueError("Sum of an empty iterable without start")
+        return out
+
+    @classmethod
+    def mean(cls, dicts):
+        "Averages an iterable of ArrayDicts accumulating in-place"
+        out, num = None, 0
+        for num, dct in enumerate(dicts, 1):
+            if out is None:
+                out = cls(dct)
+            else:
+                out += dct
+        if out is None:
+            raise ValueError("Mean of an empty iterable")
+        out /= num
+        return out
+
+
+def _reversed(fnc):
+    "Swaps the operands of a binary function"
+    return lambda left, right: fnc(right, left)
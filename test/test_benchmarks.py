@@ -0,0 +1,221 @@
+"""
+Micro-benchmarks of the hot paths of lyncs_utils.
+
+They are deselected by default and can be run either with pytest
+
+    pytest -m benchmark test/test_benchmarks.py
+
+or as a standalone module
+
+    python test/test_benchmarks.py [--output results.json] [--baseline baseline.json]
+
+Results are stored as JSON mapping "name[size]" to the best time per call in seconds.
+If a baseline is given, benchmarks slower than the baseline by more than the
+threshold (default 20%) are reported as regressions.
+With pytest, the files and the threshold are given via the environment variables
+LYNCS_BENCHMARK_OUTPUT, LYNCS_BENCHMARK_BASELINE and LYNCS_BENCHMARK_THRESHOLD.
+"""
+
+import os
+import sys
+import json
+import random
+import tempfile
+import timeit
+import argparse
+import pytest
+from lyncs_utils import (
+    prime_factors,
+    compact_indexes,
+    isiterable,
+    flat_dict,
+    nest_dict,
+    FreezableDict,
+    ndict,
+)
+from lyncs_utils.io import dbdict
+from lyncs_utils.numpy import ArrayDict
+
+BENCHMARKS = {}
+
+
+def benchmark(*sizes):
+    """
+    Registers a benchmark for the given sizes.
+    The decorated function takes the size, does the setup and returns the callable to time.
+    """
+
+    def decorator(fnc):
+        BENCHMARKS[fnc.__name__] = (fnc, sizes)
+        return fnc
+
+    return decorator
+
+
+@benchmark(10**3, 10**9, 2**61 - 1)
+def bench_prime_factors(size):
+    return lambda: list(prime_factors(size))
+
+
+@benchmark(10, 10**3, 10**5)
+def bench_compact_indexes(size):
+    rng = random.Random(size)
+    ids = sorted(rng.sample(range(2 * size), size))
+    return lambda: list(compact_indexes(ids))
+
+
+@benchmark(10, 10**3, 10**5)
+def bench_isiterable(size):
+    ids = list(range(size))
+    return lambda: isiterable(ids, int)
+
+
+@benchmark(10, 10**3, 10**5)
+def bench_flat_dict(size):
+    dct = {f"a{i}": {f"b{j}": {"c": j} for j in range(10)} for i in range(size // 10)}
+    return lambda: dict(flat_dict(dct, "/"))
+
+
+@benchmark(10, 10**3, 10**5)
+def bench_nest_dict(size):
+    dct = {f"a{i}/b{j}/c": j for i in range(size // 10) for j in range(10)}
+    return lambda: nest_dict(dct, "/")
+
+
+@benchmark(10, 10**3, 10**5)
+def bench_freezable_dict_setitem(size):
+    keys = list(range(size))
+
+    def run():
+        dct = FreezableDict()
+        for key in keys:
+            dct[key] = key
+
+    return run
+
+
+@benchmark(10, 10**3)
+def bench_dbdict(size):
+    tmpdir = tempfile.TemporaryDirectory()
+    dct = dbdict(filename=os.path.join(tmpdir.name, "bench"))
+    items = [(str(i), i) for i in range(size)]
+
+    def run(tmpdir=tmpdir):  # keeping tmpdir alive
+        dct.update(items)
+        for key, _ in items:
+            dct[key]  # pylint: disable=pointless-statement
+        dct.delmany(key for key, _ in items)
+
+    return run
+
+
+@benchmark(10, 10**3)
+def bench_ndict_sum(size):
+    dicts = [ndict({f"obs{i}": float(i) for i in range(100)}) for _ in range(size)]
+    return lambda: sum(dicts[1:], dicts[0])
+
+
+@benchmark(10, 10**3)
+def bench_ndict_inplace_sum(size):
+    dicts = [ndict({f"obs{i}": float(i) for i in range(100)}) for _ in range(size)]
+    return lambda: ndict.sum(dicts)
+
+
+@benchmark(10, 10**3)
+def bench_array_dict_sum(size):
+    dicts = [ArrayDict({f"obs{i}": float(i) for i in range(100)}) for _ in range(size)]
+    dicts = [dicts[0] * 1 for _ in range(size)]  # sharing the keys
+    return lambda: ArrayDict.sum(dicts)
+
+
+def run_benchmark(name, size, repeat=5):
+    "Returns the best time per call of the benchmark in seconds"
+    fnc = BENCHMARKS[name][0](size)
+    timer = timeit.Timer(fnc)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def compare(results, baseline, threshold=0.2):
+    "Returns the benchmarks slower than the baseline by more than threshold"
+    return {
+        key: (baseline[key], val)
+        for key, val in results.items()
+        if key in baseline and val > baseline[key] * (1 + threshold)
+    }
+
+
+def all_benchmarks():
+    "Returns the list of (name, size) of all the benchmarks"
+    return [(name, size) for name, (_, sizes) in BENCHMARKS.items() for size in sizes]
+
+
+def key(name, size):
+    "Key used for storing the results"
+    return f"{name}[{size}]"
+
+
+@pytest.fixture(scope="module")
+def results():
+    out = {}
+    yield out
+    if os.environ.get("LYNCS_BENCHMARK_OUTPUT"):
+        with open(os.environ["LYNCS_BENCHMARK_OUTPUT"], "w") as fptr:
+            json.dump(out, fptr, indent=2)
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    if not os.environ.get("LYNCS_BENCHMARK_BASELINE"):
+        return {}
+    with open(os.environ["LYNCS_BENCHMARK_BASELINE"]) as fptr:
+        return json.load(fptr)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("name,size", all_benchmarks())
+def test_benchmark(name, size, results, baseline):
+    results[key(name, size)] = run_benchmark(name, size)
+    threshold = float(os.environ.get("LYNCS_BENCHMARK_THRESHOLD", 0.2))
+    slower = compare(results, baseline, threshold)
+    assert key(name, size) not in slower
+
+
+def test_compare():
+    assert compare({"a": 1.0, "b": 1.0}, {"a": 1.0, "b": 0.5, "c": 1}) == {
+        "b": (0.5, 1.0)
+    }
+    assert compare({"a": 1.1}, {"a": 1.0}, threshold=0.2) == {}
+
+
+def main(argv=None):
+    "Runs the benchmarks and compares them to the baseline"
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-k", default="", help="run only benchmarks containing K")
+    parser.add_argument("--output", help="JSON file where to store the results")
+    parser.add_argument("--baseline", help="JSON file with the results to compare to")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    out = {}
+    for name, size in all_benchmarks():
+        if args.k in key(name, size):
+            out[key(name, size)] = run_benchmark(name, size, repeat=args.repeat)
+            print(f"{key(name, size):50s} {out[key(name, size)]:.3e} s")
+
+    if args.output:
+        with open(args.output, "w") as fptr:
+            json.dump(out, fptr, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fptr:
+            slower = compare(out, json.load(fptr), args.threshold)
+        for name, (old, new) in slower.items():
+            print(f"REGRESSION {name}: {old:.3e} s -> {new:.3e} s")
+        return int(bool(slower))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
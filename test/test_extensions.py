@@ -194,3 +194,61 @@ def test_ndict():
     assert dct / 1 == {"a": 1, "b": 0}
     assert dct**2 == {"a": 1, "b": 0}
     assert dct + {"a": 3} == {"a": 4, "b": 0}
+    with raises(KeyError):
+        dct + {"c": 3}  # pylint: disable=pointless-statement
+    assert {"a": 3} + dct == {"a": 4, "b": 0}
+    assert sum([dct, dct, dct]) == {"a": 3, "b": 0}
+    assert isinstance(dct.copy(), ndict)
+
+
+def test_ndict_inplace():
+    dct = ndict({"a": 1, "b": 0})
+    tmp = dct
+    tmp += {"a": 1}
+    tmp *= 2
+    tmp -= 1
+    tmp /= 2
+    tmp **= 2
+    assert tmp is dct
+    assert dct == {"a": 1.5**2, "b": 0.25}
+    with raises(KeyError):
+        dct += {"a": 1, "c": 1}
+    assert dct == {"a": 1.5**2, "b": 0.25}
+
+    dicts = [ndict({"a": [i], "b": i}) for i in range(5)]
+    assert ndict.sum(dicts) == {"a": list(range(5)), "b": 10}
+    assert dicts[0] == {"a": [0], "b": 0}
+    assert ndict.sum(iter(dicts[:1])) == dicts[0]
+    assert ndict.sum([], start={"a": 1}) == {"a": 1}
+
+    source = ndict({"a": [0], "b": 1})
+    acc = source.copy()
+    acc += {"a": [1], "b": 1}
+    assert acc == {"a": [0, 1], "b": 2}
+    assert source == {"a": [0], "b": 1}
+    with raises(ValueError):
+        ndict.sum([])
+
+
+def test_ndict_missing():
+    left = ndict({"a": 1, "b": 2})
+    right = {"b": 1, "c": 3}
+
+    left.missing = "fill"
+    assert left + right == {"a": 1, "b": 3, "c": 3}
+    assert (left + right).missing == "fill"
+    left.fill_value = 1
+    assert left * right == {"a": 1, "b": 2, "c": 3}
+
+    left.missing = "skip"
+    assert left - right == {"b": 1}
+
+    left.missing = "error"
+    with raises(KeyError):
+        left + right  # pylint: disable=pointless-statement
+    assert left + {"a": 0, "b": 0} == left
+
+    left.missing = "foo"
+    with raises(ValueError):
+        left + right  # pylint: disable=pointless-statement
+    assert ndict.missing == "keep"
@@ -1,8 +1,18 @@
+import asyncio
 import pytest
+import pickle
+import struct
 import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
 from pathlib import Path
 from lyncs_utils.io import *
-from lyncs_utils import first
+from lyncs_utils import first, dictzip
+from lyncs_utils.numpy import numpy
+from lyncs_utils.contextlib import setting
+import lyncs_utils.io as io
 
 
 def test_read():
@@ -104,3 +114,334 @@ def test_dbdict():
 
         with pytest.raises(KeyError):
             del tmp["foo"]
+
+
+def test_dbdict_bulk():
+    with tempfile.NamedTemporaryFile() as fp:
+        tmp = dbdict(filename=fp.name)
+
+        tmp.update({"a": 1, "b": 2}, c=3)
+        assert dict(tmp.items()) == {"a": 1, "b": 2, "c": 3}
+
+        tmp.setmany((str(i), i) for i in range(1000))
+        assert len(tmp) == 1003
+        assert tmp.getmany(["a", "10", "missing"], default=-1) == [1, 10, -1]
+        assert tmp.getmany(map(str, range(1000))) == list(range(1000))
+
+        tmp.delmany(map(str, range(1000)))
+        assert len(tmp) == 3
+
+        with tmp.transaction():
+            tmp["d"] = 4
+            with tmp.batch():
+                tmp["e"] = 5
+        assert tmp["d"] == 4 and tmp["e"] == 5
+
+        with pytest.raises(RuntimeError):
+            with tmp.transaction():
+                tmp["f"] = 6
+                del tmp["a"]
+                raise RuntimeError
+        assert "f" not in tmp
+        assert tmp["a"] == 1
+
+        with pytest.raises(RuntimeError):
+            with tmp.transaction():
+                tmp["x"] = 1
+                with pytest.raises(KeyError):
+                    with tmp.transaction():
+                        tmp["y"] = 2
+                        del tmp["a"]
+                        raise KeyError
+                with tmp.transaction():
+                    tmp["z"] = 3
+                assert "y" not in tmp and tmp["a"] == 1
+                assert tmp["x"] == 1 and tmp["z"] == 3
+                raise RuntimeError
+        assert "x" not in tmp and "z" not in tmp
+
+        with tmp.transaction():
+            with pytest.raises(KeyError):
+                with tmp.transaction():
+                    tmp["y"] = 2
+                    raise KeyError
+            tmp["x"] = 1
+        assert "y" not in tmp and tmp["x"] == 1
+
+
+def test_dbdict_streaming():
+    with tempfile.NamedTemporaryFile() as fp:
+        tmp = dbdict(filename=fp.name, fetch_size=7)
+        tmp.setmany((i, i**2) for i in range(100))
+
+        assert len(tmp) == 100
+        assert sorted(tmp.keys()) == list(range(100))
+        assert sorted(tmp.values()) == [i**2 for i in range(100)]
+        assert dict(tmp.items()) == {i: i**2 for i in range(100)}
+        assert (3, 9) in tmp.items()
+        assert 81 in tmp.values()
+
+        tmp = dbdict(filename=fp.name, fetch_size=7)
+        tmp.setmany((i, -i) for i in reversed(range(100)))
+        assert list(tmp.keys(sort=True)) == list(range(100))
+        assert list(tmp.values(sort=True)) == [-i for i in range(100)]
+        assert list(tmp.items(sort=True)) == [(i, -i) for i in range(100)]
+        assert list(dictzip(tmp, {i: i for i in range(50, 150)}, ordered=True)) == [
+            (i, (-i if i < 100 else None, i if i >= 50 else None)) for i in range(150)
+        ]
+
+
+def _dbdict_writer(args):
+    filename, rank = args
+    tmp = dbdict(filename=filename, concurrent=True)
+    for i in range(20):
+        tmp[f"{rank}/{i}"] = i
+    return len(tmp)
+
+
+def test_dbdict_concurrent():
+    with tempfile.TemporaryDirectory() as path:
+        filename = path + "/db"
+        tmp = dbdict(filename=filename, concurrent=True)
+        tmp["foo"] = "bar"
+
+        with ThreadPoolExecutor(4) as pool:
+            list(
+                pool.map(
+                    lambda i: tmp.setmany((f"{i}/{j}", j) for j in range(20)), range(4)
+                )
+            )
+        assert len(tmp) == 81
+
+        ctx = multiprocessing.get_context("fork")
+        with ctx.Pool(4) as pool:
+            pool.map(_dbdict_writer, [(filename, rank) for rank in range(4, 8)])
+        assert len(tmp) == 161
+        assert tmp["7/19"] == 19
+        assert tmp["foo"] == "bar"
+
+
+def test_dbdict_cache():
+    with tempfile.NamedTemporaryFile() as fp:
+        tmp = dbdict(filename=fp.name, cache_size=2)
+        tmp.update(a=1, b=2, c=3)
+        assert tmp.cache_info().currsize == 0
+
+        assert tmp["a"] == 1
+        assert tmp["a"] == 1
+        assert tmp.cache_info()[:4] == (1, 1, 2, 1)
+
+        assert tmp.getmany("abc") == [1, 2, 3]
+        assert tmp.cache_info().currsize == 2
+        assert tmp.cache_info().hits == 2
+
+        tmp["c"] = 4
+        assert tmp["c"] == 4
+        del tmp["c"]
+        assert "c" not in tmp
+
+        tmp.cache_clear()
+        assert tmp.cache_info() == (0, 0, 2, 0, 0)
+
+        tmp = dbdict(filename=fp.name, cache_size=10, cache_bytes=100)
+        tmp["big"] = "x" * 1000
+        assert tmp["big"] == "x" * 1000
+        assert tmp["a"] == 1
+        assert tmp.cache_info().currsize == 1
+        assert 0 < tmp.cache_info().nbytes <= 100
+
+
+@pytest.mark.skipif(isinstance(numpy, Exception), reason="Numpy not available")
+@pytest.mark.skipif(
+    pickle.HIGHEST_PROTOCOL < 5, reason="Pickle protocol 5 not available"
+)
+@pytest.mark.parametrize("compress", [None, "zlib", "lzma"])
+def test_array_serializer(compress):
+    arr = numpy.random.rand(100, 10)
+    data = {"arr": arr, "sub": arr[::2, 1], "info": [1, "a"]}
+    out = array_loads(array_dumps(data, compress=compress, threshold=0))
+    assert (out["arr"] == arr).all()
+    assert (out["sub"] == arr[::2, 1]).all()
+    assert out["info"] == [1, "a"]
+
+    with pytest.raises(ValueError):
+        array_dumps(arr, compress="foo")
+    with pytest.raises(ValueError):
+        array_loads(pickle.dumps(arr))
+
+    with tempfile.NamedTemporaryFile() as fp:
+        tmp = dbdict(
+            filename=fp.name,
+            dumps=partial(array_dumps, compress=compress),
+            loads=array_loads,
+        )
+        tmp["arr"] = arr
+        assert (tmp["arr"] == arr).all()
+
+
+@pytest.mark.skipif(isinstance(numpy, Exception), reason="Numpy not available")
+@pytest.mark.parametrize("mmap", [True, False])
+def test_read_write_array(mmap):
+    arr = numpy.random.rand(4, 5, 6)
+    with tempfile.NamedTemporaryFile() as fp:
+        filename = fp.name
+        write(filename, b"header")
+        write_array(filename, arr, offset=6)
+        assert file_size(filename) == 6 + arr.nbytes
+
+        out = read_array(filename, arr.dtype, arr.shape, offset=6, mmap=mmap)
+        assert (out == arr).all()
+        out = read_array(fp, "d", arr.shape[1:], offset=6 + arr[0].nbytes, mmap=mmap)
+        assert (out == arr[1]).all()
+
+        out = read_array(filename, "d", arr.shape, offset=6, writeable=True)
+        out[0] = 0
+        out.flush()
+        assert (read_array(filename, "d", arr.shape, offset=6)[0] == 0).all()
+        assert read(filename, 6) == b"header"
+
+        write_array(filename, arr[:, ::2])
+        assert (read_array(fp, "d", 72, mmap=mmap) == arr[:, ::2].flatten()).all()
+
+        if not mmap:
+            with pytest.raises(ValueError):
+                read_array(filename, "d", 73, mmap=mmap)
+
+
+def test_read_write_array_memoryview():
+    data = struct.pack("6d", *range(6))
+    with tempfile.NamedTemporaryFile() as fp:
+        write_array(fp.name, data)
+        for mmap in (True, False):
+            with setting(io, "numpy", ImportError()):
+                out = read_array(fp.name, "d", (2, 3), mmap=mmap)
+            assert isinstance(out, memoryview)
+            assert out.tolist() == [[0, 1, 2], [3, 4, 5]]
+
+
+@pytest.mark.parametrize("fmt", ["i", "<i2d", "@bid?", ">3h4sx2Q", "!cfe"])
+def test_read_write_structs(fmt):
+    size = struct.calcsize(fmt)
+    data = [struct.unpack(fmt, bytes(range(i + 1, i + 1 + size))) for i in range(100)]
+    with tempfile.NamedTemporaryFile() as fp:
+        filename = fp.name
+        write_structs(filename, fmt, data, chunk=7)
+        assert file_size(filename) == size * 100
+        assert read_structs(filename, fmt) == data
+        assert read_structs(filename, fmt, 10) == data[:10]
+        assert list(iter_structs(filename, fmt, chunk=7)) == data
+        assert list(iter_structs(filename, fmt, chunk=100)) == data
+        assert read_struct(filename, fmt) == data[0]
+
+        with pytest.raises(ValueError):
+            read_structs(filename, fmt, 101)
+
+        if isinstance(numpy, Exception):
+            return
+        arr = read_structs(filename, fmt, as_array=True)
+        assert len(arr) == 100
+        assert [tuple(row) for row in arr.tolist()] == data
+        write_structs(filename, fmt, arr[::-1])
+        assert read_structs(filename, fmt) == data[::-1]
+
+    with tempfile.NamedTemporaryFile() as fp:
+        write(fp.name, b"\0" * (size * 3 + 1))
+        with pytest.raises(ValueError):
+            list(iter_structs(fp.name, fmt))
+
+
+def test_read_parallel():
+    data = bytes(range(256)) * 1000
+    with tempfile.NamedTemporaryFile() as fp:
+        filename = fp.name
+        write(filename, data)
+        assert read_parallel(filename, chunk=1000, workers=4) == data
+        assert read_parallel(fp, 100, offset=10, chunk=7) == data[10:110]
+
+        out = bytearray(len(data) + 10)
+        assert read_parallel(filename, out=out) is out
+        assert out[: len(data)] == data
+
+        with pytest.raises(ValueError):
+            read_parallel(filename, len(data), offset=1)
+        with pytest.raises(ValueError):
+            read_parallel(filename, out=bytearray(10))
+
+        if not isinstance(numpy, Exception):
+            arr = numpy.empty(len(data) // 8, dtype="d")
+            read_parallel(filename, out=arr, chunk=1024)
+            assert arr.tobytes() == data
+
+
+def test_async():
+    data = b"A very random string 123456"
+
+    @open_file
+    async def aread_size(fp):
+        return len(await aread(fp))
+
+    async def main(filename):
+        await awrite(filename, data)
+        reads = await asyncio.gather(*(aread(filename) for _ in range(10)))
+        assert reads == [data] * 10
+        assert await aread(filename, 6) == data[:6]
+        assert await aread_struct(filename, "6s") == (data[:6],)
+        assert await aread_size(filename) == len(data)
+
+    with tempfile.NamedTemporaryFile() as fp:
+        assert async_executor(2) is async_executor()
+        asyncio.run(main(fp.name))
+
+
+def test_read_offset():
+    data = b"A very random string 123456"
+    with tempfile.NamedTemporaryFile() as fp:
+        filename = fp.name
+        fp.write(data)
+        assert read(fp, 6, offset=2) == data[2:8]
+        assert read(filename, offset=20) == data[20:]
+        assert read(filename, offset=100) == b""
+        fp.seek(0)
+        assert read(fp, 4, offset=7) == data[7:11]
+        assert fp.tell() == 0
+
+    fp = BytesIO(data)
+    assert read(fp, 6, offset=2) == data[2:8]
+    assert fp.tell() == 0
+
+
+def _scan_lines(fp):
+    offset = 0
+    for line in fp:
+        yield offset, len(line)
+        offset += len(line)
+
+
+def test_file_index():
+    lines = [b"line %d\n" % (i * i) for i in range(50)]
+    with tempfile.TemporaryDirectory() as path:
+        filename = Path(path) / "data.txt"
+        write(filename, b"".join(lines))
+
+        with pytest.raises(ValueError):
+            FileIndex(filename)
+
+        index = FileIndex(filename, scan=_scan_lines)
+        assert len(index) == 50
+        assert index.index_file.exists()
+        assert index[-1] == (len(b"".join(lines[:-1])), len(lines[-1]))
+        assert index.read(10) == lines[10]
+        assert index.read(3, 0, 7) == [lines[3], lines[0], lines[7]]
+        with open(filename, "rb") as fp:
+            assert index.read(*range(50), fp=fp) == lines
+        with pytest.raises(IndexError):
+            index[50]
+
+        # loaded from disk, no scan needed
+        assert list(FileIndex(filename)) == list(index)
+
+        lines.append(b"new line\n")
+        write(filename, b"".join(lines))
+        index = FileIndex(filename, scan=_scan_lines)
+        assert len(index) == 51
+        assert index.read(50) == b"new line\n"
@@ -1,15 +1,21 @@
-from pytest import raises
+import sys
+from pytest import raises, warns, mark
 from lyncs_utils import (
     first,
     last,
     indexes,
+    IndexMap,
     dictzip,
+    dictzip_columns,
     dictmap,
     flat_dict,
     nest_dict,
     compact_indexes,
+    compact_ranges,
+    RangeSet,
     allclose,
 )
+from lyncs_utils.numpy import numpy
 
 
 def test_first():
@@ -28,6 +34,36 @@ def test_indexes():
     assert tuple(indexes((1, 2, 3), 4)) == ()
     assert tuple(indexes((1, 2, 3), 1)) == (0,)
     assert tuple(indexes((1, 2, 1, 1), 1)) == (0, 2, 3)
+    assert tuple(indexes((x for x in (1, 2, 1, 1)), 1)) == (0, 2, 3)
+
+
+def test_index_map():
+    imap = IndexMap([1, 2, 1, 1, "a"])
+    assert imap[1] == (0, 2, 3)
+    assert imap["a"] == (4,)
+    assert imap.indexes(5) == ()
+    assert imap.count(1) == 3
+    assert 2 in imap and 5 not in imap
+    assert list(imap) == [1, 2, "a"]
+    assert len(imap) == 3
+    with raises(KeyError):
+        imap[5]  # pylint: disable=pointless-statement
+    assert IndexMap(x % 3 for x in range(10))[1] == (1, 4, 7)
+
+
+@mark.skipif(isinstance(numpy, Exception), reason="Numpy not available")
+def test_index_map_numpy():
+    arr = numpy.random.default_rng(0).integers(0, 10, size=(20, 5))
+    imap = IndexMap(arr)
+    assert len(imap) == len(numpy.unique(arr))
+    assert list(imap) == numpy.unique(arr).tolist()
+    for val in range(10):
+        assert imap.indexes(val).tolist() == numpy.flatnonzero(arr == val).tolist()
+        assert list(indexes(arr, val)) == list(
+            IndexMap(arr.ravel().tolist()).indexes(val)
+        )
+    assert 10 not in imap
+    assert imap.count(10) == 0
 
 
 def test_dictmap():
@@ -41,6 +77,66 @@ def test_dictzip():
     assert dict(dictzip(dict1)) == dict(dictmap(lambda _: (_,), dict1))
     assert dict(dictzip(dict1, dict2)) == dict(a=(1, "a"), b=(2, "b"), c=(3, None))
     assert dict(dictzip(dict1, dict2, fill=False)) == dict(a=(1, "a"), b=(2, "b"))
+    assert list(dictzip(dict(b=1, a=2), dict(c=3, a=4))) == [
+        ("b", (1, None)),
+        ("a", (2, 4)),
+        ("c", (None, 3)),
+    ]
+    assert list(dictzip(dict(b=1, a=2), dict(c=3, a=4), fill=False)) == [("a", (2, 4))]
+
+
+def test_dictzip_ordered():
+    dict1 = dict(a=1, b=2, d=4)
+    pairs = ((key, -val) for key, val in [("b", 2), ("c", 3), ("d", 4)])
+    assert list(dictzip(dict1, pairs, ordered=True)) == [
+        ("a", (1, None)),
+        ("b", (2, -2)),
+        ("c", (None, -3)),
+        ("d", (4, -4)),
+    ]
+    assert list(dictzip(dict1, dict(b=0, d=0), ordered=True, fill=False)) == [
+        ("b", (2, 0)),
+        ("d", (4, 0)),
+    ]
+    assert list(
+        dictzip([(3, "c"), (1, "a")], [(2, "b")], ordered=True, key=lambda _: -_)
+    ) == [(3, ("c", None)), (2, (None, "b")), (1, ("a", None))]
+    with raises(ValueError):
+        list(dictzip(dict(b=1, a=2), dict(a=1), ordered=True))
+    with raises(ValueError):
+        list(dictzip([(3, "c"), (1, "a")], [(2, "b")], ordered=True))
+
+    dict1 = {i: i for i in range(0, 100, 2)}
+    dict2 = {i: -i for i in range(0, 100, 3)}
+    dict3 = {i: 1 for i in range(0, 100, 5)}
+    ordered = list(dictzip(dict1, dict2, dict3, ordered=True, default=0))
+    assert ordered == sorted(dictzip(dict1, dict2, dict3, default=0))
+    ordered = list(dictzip(dict1, dict2, dict3, ordered=True, fill=False))
+    assert ordered == [
+        (0, (0, 0, 1)),
+        (30, (30, -30, 1)),
+        (60, (60, -60, 1)),
+        (90, (90, -90, 1)),
+    ]
+
+
+@mark.skipif(isinstance(numpy, Exception), reason="Numpy not available")
+def test_dictzip_columns():
+    dict1 = dict(a=1, b=2, c=3)
+    dict2 = dict(c=0.5, a=1.5)
+    names, (col1, col2) = dictzip_columns(dict1, dict2)
+    assert names == ["a", "b", "c"]
+    assert col1.tolist() == [1, 2, 3]
+    assert numpy.allclose(col2, [1.5, numpy.nan, 0.5], equal_nan=True)
+
+    names, (col1, col2) = dictzip_columns(dict1, dict2, fill=False, dtype=int)
+    assert names == ["a", "c"]
+    assert col1.tolist() == [1, 3] and col2.tolist() == [1, 0]
+
+    names, cols = dictzip_columns(sorted(dict2.items()), dict1, ordered=True, default=0)
+    assert names == ["a", "b", "c"]
+    assert numpy.array(cols).tolist() == [[1.5, 0, 0.5], [1, 2, 3]]
+    assert dictzip_columns({}, {}, ordered=True)[1][0].shape == (0,)
 
 
 def test_flatdict():
@@ -62,6 +158,35 @@ def test_flatdict():
     assert dict(flat_dict(dict2, " ")) == dict2
     assert nest_dict(dict2, " ")["foo"] == dict1
 
+    dict1 = {"a": {"b": 1, "c": {"d": 2}}, "e": 3, "f": {}, "g": {"h": 4}}
+    dict2 = dict(flat_dict(dict1, "/"))
+    assert list(dict2) == ["a/b", "a/c/d", "e", "g/h"]
+    assert nest_dict(dict2, "/") == {
+        "a": {"b": 1, "c": {"d": 2}},
+        "e": 3,
+        "g": {"h": 4},
+    }
+    assert nest_dict(dict(flat_dict(dict1))) == nest_dict(dict2, "/")
+    with raises(TypeError):
+        nest_dict({"a/b": 1, "a": 2, "a/c": 3}, "/")
+    with raises(TypeError):
+        nest_dict({("a", "b"): 1, ("a",): 2, ("a", "c"): 3})
+
+
+def test_deep_dict():
+    depth = 10 * sys.getrecursionlimit()
+    dct = val = {}
+    for i in range(depth):
+        val[str(i)] = val = {}
+    val["leaf"] = 1
+
+    ((key, val),) = flat_dict(dct, ".")
+    assert key == ".".join(map(str, range(depth))) + ".leaf"
+    assert val == 1
+    ((key, val),) = flat_dict(dct)
+    assert len(key) == depth + 1
+    assert dict(flat_dict(nest_dict({key: val}))) == {key: val}
+
 
 def test_example():
     assert list(compact_indexes([1, 2, 4, 6, 7, 8, 10, 12, 13])) == [
@@ -79,6 +204,83 @@ def test_range():
     assert list(compact_indexes(range(2, 20, 2)))[0] == range(2, 20, 2)
 
 
+def test_compact_iterator():
+    ids = [1, 2, 4, 6, 7, 8, 10, 12, 13]
+    assert list(compact_indexes(iter(ids))) == list(compact_indexes(ids))
+    assert list(compact_indexes(i for i in range(10**4))) == [range(10**4)]
+
+
+@mark.skipif(isinstance(numpy, Exception), reason="Numpy not available")
+def test_compact_ranges():
+    ids = [1, 2, 4, 6, 7, 8, 10, 12, 13]
+    assert compact_ranges(ids).tolist() == [
+        [1, 2, 1],
+        [2, 7, 2],
+        [7, 8, 1],
+        [8, 13, 2],
+        [13, 14, 1],
+    ]
+    assert list(compact_indexes(numpy.array(ids))) == list(compact_indexes(ids))
+    assert compact_ranges(numpy.arange(10, 0, -1)).tolist() == [[10, 0, -1]]
+    assert compact_ranges([]).shape == (0, 3)
+    assert compact_ranges([5]).tolist() == [[5, 6, 1]]
+
+    rng = numpy.random.default_rng(0)
+    for _ in range(100):
+        ids = numpy.cumsum(rng.choice([-1, 0, 1, 2, 3], size=50))
+        assert list(compact_indexes(ids)) == list(compact_indexes(ids.tolist()))
+
+    with raises(TypeError):
+        compact_ranges([0.1, 0.2])
+    with raises(TypeError):
+        compact_ranges(numpy.zeros((2, 2), dtype=int))
+
+
+@mark.skipif(isinstance(numpy, Exception), reason="Numpy not available")
+def test_range_set():
+    rset = RangeSet(compact_indexes([1, 2, 4, 6, 7, 8, 10, 12, 13]))
+    assert len(rset) == 9
+    assert list(rset) == [1, 2, 4, 6, 7, 8, 10, 12, 13]
+    assert 8 in rset and 9 not in rset and 0 not in rset
+    assert rset == {1, 2, 4, 6, 7, 8, 10, 12, 13}
+
+    evens = RangeSet([range(0, 10**12, 2)])
+    assert len(evens) == 5 * 10**11
+    assert (evens & RangeSet([range(0, 10**12, 3)])).ranges == (range(0, 10**12, 6),)
+    assert (evens | RangeSet([range(1, 10**12, 2)])).ranges == (range(0, 10**12),)
+    assert not evens - RangeSet([range(0, 10**12)])
+    assert (RangeSet([range(0, 10**12)]) - evens).ranges == (range(1, 10**12, 2),)
+    assert set(rset & evens) == {2, 4, 6, 8, 10, 12}
+    union = rset | evens
+    assert len(union) == len(evens) + 3
+    assert all(val in union for val in (1, 7, 13, 14, 10**12 - 2))
+    assert set(rset - evens) == {1, 7, 13}
+    assert list(RangeSet([range(10, 0, -2), 5, range(3, 6)])) == [2, 3, 4, 5, 6, 8, 10]
+
+    rng = numpy.random.default_rng(0)
+    for _ in range(100):
+        left = set(rng.integers(0, 50, size=20).tolist())
+        right = set(rng.integers(0, 50, size=20).tolist())
+        lset = RangeSet(compact_indexes(sorted(left)))
+        rset = RangeSet(compact_ranges(sorted(right)))
+        assert set(lset | rset) == left | right
+        assert set(lset & rset) == left & right
+        assert set(lset - rset) == left - right
+        assert (lset | rset).to_array().tolist() == sorted(left | right)
+
+    with raises(TypeError):
+        RangeSet([0.5])
+    assert list(RangeSet([range(20)]) - RangeSet([range(1, 20, 4)])) == [
+        val for val in range(20) if val % 4 != 1
+    ]
+    diff = RangeSet([range(10**5)]) - RangeSet([range(0, 10**5, 3)])
+    assert len(diff) == 10**5 - len(range(0, 10**5, 3))
+    assert len(diff.ranges) == len(range(0, 10**5, 3)) - 1
+    union = RangeSet([range(0, 10**5, 2)]) | RangeSet([range(0, 10**5, 3)])
+    assert len(union) == len({*range(0, 10**5, 2), *range(0, 10**5, 3)})
+    assert all(val in union for val in (0, 2, 3, 4, 6, 99999)) and 5 not in union
+
+
 def test_error():
     with raises(TypeError):
         list(compact_indexes(1))
@@ -96,3 +298,34 @@ def test_allclose():
     assert allclose(0, {"a": 0, "b": {"c": 0}})
     assert allclose({"a": 0, "b": {"c": 0}}, {"b": {"c": 0}, "a": 0})
     assert not allclose({"a": 0, "b": {"c": "d"}}, 0)
+
+
+@mark.skipif(isinstance(numpy, Exception), reason="Numpy not available")
+def test_allclose_arrays():
+    arr = numpy.random.rand(1000)
+    assert allclose(arr, arr.copy())
+    assert allclose(arr, list(arr))
+    assert not allclose(arr, arr[::-1])
+    assert not allclose(arr, arr[:-1])
+    assert allclose(arr * 0, 0)
+    assert allclose(arr + 1e-4, arr, abs_tol=1e-3)
+    assert not allclose(arr + 1e-4, arr, abs_tol=1e-5)
+    assert allclose(arr * 1j, arr * (1 + 1e-12) * 1j)
+    with warns():
+        assert allclose(arr * 1.01, arr, warn_tol=0.1)
+    assert not allclose(arr * 1.2, arr, warn_tol=0.1)
+
+    nested = {"a": arr, "b": [arr, {"c": 1, "d": "foo"}], "e": True}
+    copy = {"b": [arr.copy(), {"c": 1.0, "d": "foo"}], "a": list(arr), "e": 1}
+    assert allclose(nested, copy)
+    copy["b"][1]["d"] = "bar"
+    assert not allclose(nested, copy)
+    assert not allclose({"a": arr}, {"a": arr + 1})
+    assert not allclose(numpy.array([1, numpy.inf]), [1, 2])
+    assert allclose(numpy.array([1, numpy.inf]), [1, numpy.inf])
+    assert allclose([2**70, 1.0], [2**70, 1])
+    assert not allclose(arr[:2], ["a", "b"])
+    assert not allclose(numpy.array([1, 1, 1]), [1])
+    assert allclose(numpy.ones((2, 3)), [1, 1])
+    assert not allclose(numpy.ones((2, 3)), [1, 1, 1])
+    assert allclose(numpy.ones((2, 3)), [[1, 1, 1], numpy.ones(3)])
@@ -1,10 +1,49 @@
-from pytest import warns
-from lyncs_utils import isclose, prime_factors, factors, prod, sign, iscomplex
+from pytest import warns, raises, mark
+from lyncs_utils import (
+    isclose,
+    prime_factors,
+    factors,
+    prod,
+    sign,
+    iscomplex,
+    is_complex_dtype,
+    is_prime,
+    divisors,
+    divisor_pairs,
+    factorizations_into,
+    best_grid,
+    FactorTable,
+    factor_table,
+)
+from lyncs_utils.numpy import numpy
+from lyncs_utils.contextlib import setting
+import lyncs_utils.math
 
 
 def test_iscomplex():
     assert iscomplex(1j)
+    assert iscomplex(1 + 0j)
+    assert not iscomplex(1 + 0j, scan=True)
     assert not iscomplex(1)
+    assert not iscomplex("a")
+    assert iscomplex([1, (2, 3j)])
+    assert not iscomplex([1, (2, 3)])
+    assert is_complex_dtype(complex)
+    assert not is_complex_dtype(float)
+
+
+@mark.skipif(isinstance(numpy, Exception), reason="Numpy not available")
+def test_iscomplex_numpy():
+    arr = numpy.zeros(10, dtype=complex)
+    assert iscomplex(arr)
+    assert not iscomplex(arr, scan=True)
+    arr[3] = 1j
+    assert iscomplex(arr, scan=True)
+    assert iscomplex(arr[0])
+    assert not iscomplex(arr.real)
+    assert not iscomplex(numpy.float32(1))
+    assert is_complex_dtype("complex64")
+    assert not is_complex_dtype("int32")
 
 
 def test_isclose():
@@ -15,6 +54,26 @@ def test_isclose():
     assert isclose(1j, 1.0001j, abs_tol=0.0001)
     assert isclose(1j, 1.0001j, rel_tol=0.0001)
     assert not isclose(1j, 1.0002j, abs_tol=0.0001)
+    assert isclose(0j, 0, rel_tol=1e-9)
+    assert isclose(0j, 0j, rel_tol=1e-3)
+    assert not isclose(1 + 0j, -1 + 0j, rel_tol=1e-9)
+    with warns():
+        assert isclose(1j, 1.01j, warn_tol=0.1)
+
+
+@mark.skipif(isinstance(numpy, Exception), reason="Numpy not available")
+def test_isclose_arrays():
+    arr = numpy.array([1.0, 2.0, numpy.inf, 0.0])
+    assert isclose(arr, arr * (1 + 1e-12)).all()
+    assert isclose(arr[[0, 1, 3]] * 1j, arr[[0, 1, 3]] * 1j * (1 + 1e-12)).all()
+    assert (
+        isclose(arr, [1.0001, 2.0, numpy.inf, 0], abs_tol=1e-3).tolist() == [True] * 4
+    )
+    assert isclose(arr, 1.0).tolist() == [True, False, False, False]
+    with warns():
+        out = isclose(arr, [1.01, 3.0, numpy.inf, 0], warn_tol=0.1)
+    assert out.tolist() == [True, False, True, True]
+    assert (isclose(numpy.array(["a", "b"]), "a") == [True, False]).all()
     assert isclose("a", "a")
 
 
@@ -24,9 +83,117 @@ def test_sign():
     assert sign(-2) == -1
 
 
+@mark.skipif(isinstance(numpy, Exception), reason="Numpy not available")
+def test_array_prod_sign():
+    assert prod(numpy.arange(1, 6)) == 120
+    assert (prod(numpy.array([[1, 2], [3, 4]])) == [3, 8]).all()
+    shapes = [(4, 4, 4, 8), (8, 8, 8, 16), (2, 2, 2, 2)]
+    assert list(prod(shapes, axis=-1)) == [512, 8192, 16]
+    assert prod(numpy.full(5, 2**20), axis=0) == 2**100
+    assert prod(numpy.array([1.5, 2.0]), start=2) == 6.0
+    assert prod([2, 3], start=2) == 12
+
+    assert (sign(numpy.array([-1, 0, 2])) == [-1, 1, 1]).all()
+    assert (sign([-3.0, 4.0]) == [-1, 1]).all()
+
+
 def test_factors():
     nums = [1, 20, 30, 123, 211]
     for num in nums:
         assert prod(prime_factors(num)) == num
         assert prod(factors(num)) % num == 0
         assert prod(prime_factors(num**2)) == num**2
+
+
+def test_prime_factors():
+    assert list(prime_factors(1)) == []
+    assert list(prime_factors(360)) == [2, 2, 2, 3, 3, 5]
+    for num in range(2, 2000):
+        facts = list(prime_factors(num))
+        assert prod(facts) == num
+        assert facts == sorted(facts)
+        assert all(map(is_prime, facts))
+    assert list(prime_factors(2**61 - 1)) == [2**61 - 1]
+    assert list(prime_factors(600851475143)) == [71, 839, 1471, 6857]
+    assert list(prime_factors((2**31 - 1) * (2**31 - 19) * 4)) == [
+        2,
+        2,
+        2**31 - 19,
+        2**31 - 1,
+    ]
+
+
+def test_is_prime():
+    primes = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47]
+    assert [num for num in range(50) if is_prime(num)] == primes
+    assert is_prime(2**89 - 1)
+    assert not is_prime(3215031751)  # strong pseudoprime to bases 2, 3, 5, 7
+
+
+def test_divisors():
+    assert list(factors(1)) == [1]
+    assert list(factors(4)) == [2, 4]
+    assert list(factors(12)) == [2, 3, 4, 6, 12]
+    assert sorted(factors(360, sort=False)) == list(factors(360))
+    assert divisors(12) == (1, 2, 3, 4, 6, 12)
+    assert divisors(97) == (1, 97)
+    for num in range(1, 500):
+        assert divisors(num) == tuple(i for i in range(1, num + 1) if num % i == 0)
+    assert list(divisor_pairs(36)) == [(1, 36), (2, 18), (3, 12), (4, 9), (6, 6)]
+    for num in (0, -12):
+        with raises(ValueError):
+            divisors(num)
+        with raises(ValueError):
+            list(divisor_pairs(num))
+
+
+def test_factorizations_into():
+    assert list(factorizations_into(7, 1)) == [(7,)]
+    assert list(factorizations_into(12, 2, ordered=False)) == [(1, 12), (2, 6), (3, 4)]
+    assert len(list(factorizations_into(12, 2))) == 6
+    for num in (1, 16, 60, 97):
+        for parts in (2, 3, 4):
+            ordered = set(factorizations_into(num, parts))
+            unordered = list(factorizations_into(num, parts, ordered=False))
+            assert all(prod(facts) == num for facts in ordered)
+            assert set(unordered) == {tuple(sorted(facts)) for facts in ordered}
+            assert len(unordered) == len(set(unordered))
+    with raises(ValueError):
+        list(factorizations_into(12, 0))
+    for num in (0, -12):
+        with raises(ValueError):
+            list(factorizations_into(num, 1))
+        with raises(ValueError):
+            list(factorizations_into(num, 2))
+
+
+def test_best_grid():
+    assert best_grid((8, 8, 8, 16), 1) == (1, 1, 1, 1)
+    assert best_grid((8, 8, 8, 16), 16) == (1, 1, 2, 8)
+    assert best_grid([4, 4, 4, 4], 16) == (1, 1, 4, 4)
+    assert best_grid((6, 10), 15) == (3, 5)
+    assert best_grid((16, 16, 16, 32), 4096) == (4, 8, 8, 16)
+    assert best_grid((4, 8, 8, 64), 64) == (1, 1, 2, 32)
+    assert best_grid((4, 8, 8, 64), 64, min_local=4) == (1, 2, 2, 16)
+    with raises(ValueError):
+        best_grid((8, 8), 3)
+    with raises(ValueError):
+        best_grid((8, 8), 64, min_local=2)
+
+
+def test_factor_table():
+    table = factor_table(1000)
+    assert factor_table(100) is table
+    assert len(table) == 1001
+    assert table[0] == table[1] == []
+    for num in range(2, 1001):
+        assert table[num] == list(prime_factors(num))
+        assert table.is_prime(num) == is_prime(num)
+    assert table.smallest_prime_factor(91) == 7
+    assert table.smallest_prime_factor(97) == 97
+    with raises(ValueError):
+        table[1001]
+
+    with setting(lyncs_utils.math, "numpy", ImportError()):
+        table2 = FactorTable(1000)
+    assert table2.table == table.table
@@ -57,3 +57,77 @@ def test_su_generators():
             assert (gen == -gen.transpose().conj()).all()
             assert allclose(gen.trace(), 0, abs_tol=ncol * 1e-16)
             assert allclose(gen.dot(gen).trace(), -1 / 2, abs_tol=ncol * 1e-16)
+
+
+@skip
+def test_array_dict():
+    dct = ArrayDict({"a": 1, "b": 0})
+    assert dct + 1 == {"a": 2, "b": 1}
+    assert dct - 2 == {"a": -1, "b": -2}
+    assert 2 - dct == {"a": 1, "b": 2}
+    assert dct * 3 == {"a": 3, "b": 0}
+    assert 3 * dct == {"a": 3, "b": 0}
+    assert dct / 2 == {"a": 0.5, "b": 0}
+    assert dct**2 == {"a": 1, "b": 0}
+    assert dct + {"a": 3} == {"a": 4, "b": 0}
+    assert dct + dct == {"a": 2, "b": 0}
+    assert -dct == {"a": -1, "b": 0}
+    with pytest.raises(KeyError):
+        dct + {"c": 1}  # pylint: disable=pointless-statement
+    assert {"b": 1, "a": 10} - dct == {"a": 9, "b": 1}
+    with pytest.raises(KeyError):
+        {"a": 10} - dct  # pylint: disable=pointless-statement
+    with pytest.raises(KeyError):
+        {"a": 10} / dct  # pylint: disable=pointless-statement
+
+    # same keys are shared and aligned
+    other = dct * 2
+    assert other._keys is dct._keys
+    assert dct + ArrayDict({"b": 1, "a": 2}) == {"a": 3, "b": 1}
+
+    tmp = dct.copy()
+    array = tmp.array
+    tmp += other
+    assert tmp.array is array
+    assert tmp == {"a": 3, "b": 0}
+    tmp *= 2
+    assert tmp == {"a": 6, "b": 0}
+    tmp /= 4
+    assert tmp == {"a": 1.5, "b": 0}
+    array = tmp.array
+    tmp += {"b": 1}
+    tmp **= 2
+    assert tmp.array is array
+    assert tmp == {"a": 2.25, "b": 1}
+    tmp += {"a": 0.75, "b": 0}
+    tmp -= 1
+    assert tmp == {"a": 2, "b": 0}
+    assert dct == {"a": 1, "b": 0}
+
+    tmp["c"] = 1
+    del tmp["a"]
+    assert tmp == {"b": 0, "c": 1}
+    assert list(tmp) == ["b", "c"]
+    assert "a" not in tmp
+
+    tmp = ArrayDict()
+    tmp["x"] = numpy.ones(3)
+    tmp["y"] = numpy.zeros(3)
+    assert tmp.array.shape == (2, 3)
+    assert (tmp["x"] == 1).all()
+
+
+@skip
+def test_array_dict_reductions():
+    dicts = [
+        ArrayDict({"x": numpy.full(3, i), "y": numpy.arange(3)}) for i in range(10)
+    ]
+    total = ArrayDict.sum(dicts)
+    assert total["x"].tolist() == [45] * 3
+    assert total["y"].tolist() == [0, 10, 20]
+    assert dicts[0]["x"].tolist() == [0] * 3
+    mean = ArrayDict.mean(iter(dicts))
+    assert mean["x"].tolist() == [4.5] * 3
+    assert ArrayDict.sum([], start={"y": 1}) == {"y": 1}
+    with pytest.raises(ValueError):
+        ArrayDict.mean([])